@@ -108,6 +108,14 @@ REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
 REDIS_PORT = os.getenv("REDIS_PORT", "6379")
 CELERY_BROKER_URL = f"redis://{REDIS_HOST}:{REDIS_PORT}/0"
 CELERY_RESULT_BACKEND = f"redis://{REDIS_HOST}:{REDIS_PORT}/0"
+# Run the worker with --beat (or a separate celery beat) so queued jobs are dispatched
+# even when no job is created or finishes, e.g. after stale in-flight jobs time out
+CELERY_BEAT_SCHEDULE = {
+    "dispatch-queued-jobs": {
+        "task": "jobs.tasks.dispatch_queued",
+        "schedule": float(os.getenv("JOB_SCHEDULER_DISPATCH_INTERVAL", "30")),
+    },
+}
 
 # External model service
 SERVICE_HOST = os.getenv("MODEL_SERVICE_HOST", "localhost")
@@ -132,6 +140,10 @@ LOGGING = {
 }
 
 # Cache
+# LocMemCache is per process: entries the Celery worker deletes (job sessions) stay in
+# the web process until they expire. Use a shared backend in production, e.g.
+# CACHE_BACKEND=django.core.cache.backends.redis.RedisCache and
+# CACHE_LOCATION=redis://<REDIS_HOST>:<REDIS_PORT>/1
 CACHES = {
     "default": {
         "BACKEND": os.getenv("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
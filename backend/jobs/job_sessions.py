@@ -0,0 +1,43 @@
+import os
+import time
+from typing import Optional
+from django.core.cache import cache
+from dotenv import load_dotenv
+from .models import Job
+
+load_dotenv()
+
+TTL_SECONDS = 6 * 60 * 60  # 6h, longer than any job runs
+FINISHED_STATUSES = ("done", "failed", "cancelled")
+# How old a cached entry may get before the job's status is read from the database again.
+# forget_job_session runs in the Celery worker and only reaches a shared cache backend.
+JOB_SESSION_RECHECK_SECONDS = float(os.getenv("JOB_SESSION_RECHECK_SECONDS", "30"))
+
+def _key(job_id) -> str:
+    return f"job_session:{job_id}"
+
+def remember_job_session(job_id, session_id: str) -> None:
+    if session_id:
+        cache.set(_key(job_id), {"session_id": session_id, "checked": time.time()}, TTL_SECONDS)
+
+def get_job_session(job_id) -> Optional[str]:
+    """
+    Resolves job -> session for progress ticks from the cache, falling back to
+    the database once. Stale entries are rechecked and dropped once the job has
+    finished, so a per-process cache does not keep them after the worker forgets them.
+    """
+    entry = cache.get(_key(job_id))
+    if isinstance(entry, dict) and time.time() - entry["checked"] < JOB_SESSION_RECHECK_SECONDS:
+        return entry["session_id"]
+    job = Job.objects.filter(id=job_id).values("session_id", "status").first()
+    if not job:
+        forget_job_session(job_id)
+        return None
+    if job["status"] in FINISHED_STATUSES:
+        forget_job_session(job_id)
+    else:
+        remember_job_session(job_id, job["session_id"])
+    return job["session_id"]
+
+def forget_job_session(job_id) -> None:
+    cache.delete(_key(job_id))
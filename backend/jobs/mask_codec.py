@@ -0,0 +1,23 @@
+import numpy as np
+
+# Wire format of the model service, see model_service/services/mask_codec.py.
+RLE_FORMAT = "rle"
+
+
+def decode_segmentations(segmentations):
+    """
+    Decodes the segmentations of one image into a single (n, h, w) bool array.
+    RLE masks ({"size": [h, w], "counts": [...]}) share a size, so all runs are
+    expanded by a single np.repeat instead of one decode per mask. The legacy
+    nested lists of ints are accepted as well.
+    """
+    if not all(isinstance(seg, dict) and "counts" in seg for seg in segmentations):
+        return np.asarray(segmentations, dtype=bool)
+
+    height, width = segmentations[0]["size"]
+    counts = [np.asarray(seg["counts"], dtype=np.int64) for seg in segmentations]
+    # runs alternate background / foreground starting over for every mask
+    values = np.concatenate([np.arange(len(c)) % 2 == 1 for c in counts])
+    flat = np.repeat(values, np.concatenate(counts))
+    # COCO RLE is column-major per mask
+    return flat.reshape((len(segmentations), width, height)).transpose(0, 2, 1)
@@ -0,0 +1,116 @@
+import os
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image as PILImage
+from dotenv import load_dotenv
+from .mask_codec import decode_segmentations
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+BASE_MEDIA_ROOT = os.getenv("MEDIA_ROOT", "/data/media")
+MASKS_DIR = os.path.join(BASE_MEDIA_ROOT, "outputs", "masks")
+
+# "eager" writes every per-mask PNG right after segmentation, "lazy" only when first requested
+MASK_PNG_MODE = os.getenv("MASK_PNG_MODE", "eager")
+# Threads encoding per-mask PNGs, zlib releases the GIL so they run in parallel
+MASK_PNG_WORKERS = int(os.getenv("MASK_PNG_WORKERS", "4"))
+# Masks are flat alpha planes, light compression is nearly as small and much faster
+MASK_PNG_COMPRESS_LEVEL = int(os.getenv("MASK_PNG_COMPRESS_LEVEL", "1"))
+
+_png_pool = ThreadPoolExecutor(max_workers=MASK_PNG_WORKERS, thread_name_prefix="mask-png")
+
+
+def artifact_path(job_id):
+    return os.path.join(MASKS_DIR, f"job_{job_id}_masks.npz")
+
+
+def metadata_path(job_id):
+    return os.path.join(MASKS_DIR, f"job_{job_id}_masks.json")
+
+
+def png_path(job_id, index):
+    return os.path.join(MASKS_DIR, f"job_{job_id}_mask_{index}.png")
+
+
+def stack_masks(masks):
+    """Decodes every mask's segmentation into one (n, h, w) bool array."""
+    return decode_segmentations([mask["segmentation"] for mask in masks])
+
+
+def _mask_metadata(mask, index, area):
+    return {
+        "index": index,
+        "bbox": [float(value) for value in mask.get("bbox", [])],
+        "area": int(area),
+        "score": float(mask["predicted_iou"]) if "predicted_iou" in mask else None,
+        "stability_score": float(mask["stability_score"]) if "stability_score" in mask else None,
+    }
+
+
+def save_masks(masks, job_id):
+    """
+    Writes the bit-packed artifact and the per-mask metadata of a job.
+    Returns (stack, metadata) so per-mask PNGs can be written without decoding again.
+    """
+    os.makedirs(MASKS_DIR, exist_ok=True)
+    stack = stack_masks(masks)
+    count, height, width = stack.shape
+
+    packed = np.packbits(stack.reshape(count, -1), axis=1)
+    np.savez_compressed(artifact_path(job_id), bits=packed, shape=np.array([count, height, width]))
+
+    areas = stack.reshape(count, -1).sum(axis=1)
+    metadata = {
+        "job_id": job_id,
+        "size": [height, width],
+        "masks": [_mask_metadata(mask, i, areas[i]) for i, mask in enumerate(masks)],
+    }
+    with open(metadata_path(job_id), "w") as f:
+        json.dump(metadata, f)
+    return stack, metadata
+
+
+def load_metadata(job_id):
+    with open(metadata_path(job_id)) as f:
+        return json.load(f)
+
+
+def load_mask(job_id, index):
+    """Unpacks a single mask from the artifact."""
+    with np.load(artifact_path(job_id)) as artifact:
+        count, height, width = artifact["shape"]
+        if not 0 <= index < count:
+            raise IndexError(f"Job {job_id} has no mask {index}")
+        bits = np.unpackbits(artifact["bits"][index], count=height * width)
+    return bits.reshape(height, width).astype(bool)
+
+
+def write_png(mask, path):
+    """Transparent PNG whose alpha channel is the mask."""
+    height, width = mask.shape
+    rgba = np.zeros((height, width, 4), dtype=np.uint8)
+    rgba[..., 3] = mask * np.uint8(255)
+    PILImage.fromarray(rgba).save(path, format="PNG", compress_level=MASK_PNG_COMPRESS_LEVEL)
+    return path
+
+
+def write_pngs(stack, job_id):
+    """Writes every per-mask PNG on the worker pool, returns their paths in order."""
+    futures = [_png_pool.submit(write_png, mask, png_path(job_id, i)) for i, mask in enumerate(stack)]
+    return [future.result() for future in futures]
+
+
+def render_png(job_id, index):
+    """Path of a per-mask PNG, written from the artifact on first request."""
+    path = png_path(job_id, index)
+    if not os.path.exists(path):
+        # concurrent first requests must never serve a half-written file
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        write_png(load_mask(job_id, index), tmp_path)
+        os.replace(tmp_path, path)
+    return path
@@ -0,0 +1,146 @@
+import os
+import time
+import threading
+from collections import defaultdict
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from django.conf import settings
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Keep-alive connections to the model service per process (web worker or Celery child)
+MODEL_SERVICE_POOL_SIZE = int(os.getenv("MODEL_SERVICE_POOL_SIZE", "8"))
+# Wait for a free connection instead of opening throwaway ones when the pool is exhausted
+MODEL_SERVICE_POOL_BLOCK = os.getenv("MODEL_SERVICE_POOL_BLOCK", "true").lower() == "true"
+# Retries of refused connections (any method) and 502/503/504 answers (GET only)
+MODEL_SERVICE_RETRIES = int(os.getenv("MODEL_SERVICE_RETRIES", "2"))
+MODEL_SERVICE_CONNECT_TIMEOUT = float(os.getenv("MODEL_SERVICE_CONNECT_TIMEOUT", "3"))
+
+# Read timeouts per kind of endpoint
+READ_TIMEOUTS = {
+    "metadata": float(os.getenv("MODEL_SERVICE_METADATA_TIMEOUT", "10")),
+    "control": float(os.getenv("MODEL_SERVICE_CONTROL_TIMEOUT", "5")),
+    "interactive": float(os.getenv("MODEL_SERVICE_INTERACTIVE_TIMEOUT", "60")),
+    "inference": float(os.getenv("MODEL_SERVICE_INFERENCE_TIMEOUT", "120")),
+    "upscale": float(os.getenv("MODEL_SERVICE_UPSCALE_TIMEOUT", "300")),
+}
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+_stats_lock = threading.Lock()
+_in_flight = 0
+_stats = {
+    "requests": 0,
+    "errors": 0,
+    "max_in_flight": 0,
+    # requests started while every pooled connection was busy
+    "saturated": 0,
+}
+_kind_stats = defaultdict(lambda: {"count": 0, "errors": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+
+
+def _new_session():
+    retry = Retry(
+        total=MODEL_SERVICE_RETRIES,
+        connect=MODEL_SERVICE_RETRIES,
+        read=0,
+        status=MODEL_SERVICE_RETRIES,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset({"GET"}),
+        backoff_factor=0.3,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=MODEL_SERVICE_POOL_SIZE,
+        pool_block=MODEL_SERVICE_POOL_BLOCK,
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_session():
+    """The process' pooled session, recreated after a fork so Celery children never share sockets."""
+    global _session, _session_pid
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        with _session_lock:
+            if _session is None or _session_pid != pid:
+                _session = _new_session()
+                _session_pid = pid
+    return _session
+
+
+def _url(path):
+    if path.startswith(("http://", "https://")):
+        return path
+    return f"{settings.MODEL_SERVICE_URL.rstrip('/')}/{path.lstrip('/')}"
+
+
+def request(method, path, kind="metadata", **kwargs):
+    """
+    Sends a request to the model service over the pooled session.
+    kind picks the read timeout (see READ_TIMEOUTS), an explicit timeout wins.
+    """
+    global _in_flight
+    kwargs.setdefault("timeout", (MODEL_SERVICE_CONNECT_TIMEOUT, READ_TIMEOUTS[kind]))
+
+    with _stats_lock:
+        if _in_flight >= MODEL_SERVICE_POOL_SIZE:
+            _stats["saturated"] += 1
+        _in_flight += 1
+        _stats["requests"] += 1
+        _stats["max_in_flight"] = max(_stats["max_in_flight"], _in_flight)
+
+    started = time.perf_counter()
+    failed = False
+    try:
+        return get_session().request(method, _url(path), **kwargs)
+    except requests.RequestException:
+        failed = True
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        with _stats_lock:
+            _in_flight -= 1
+            timing = _kind_stats[kind]
+            timing["count"] += 1
+            timing["total_seconds"] += elapsed
+            timing["max_seconds"] = max(timing["max_seconds"], elapsed)
+            if failed:
+                _stats["errors"] += 1
+                timing["errors"] += 1
+
+
+def get(path, kind="metadata", **kwargs):
+    return request("GET", path, kind, **kwargs)
+
+
+def post(path, kind="inference", **kwargs):
+    return request("POST", path, kind, **kwargs)
+
+
+def client_stats():
+    """Pool usage of this process only, every web and Celery process keeps its own pool."""
+    # slots of the urllib3 pool not held by a request: idle keep-alive or not yet opened
+    free_slots = None
+    if _session is not None and _session_pid == os.getpid():
+        adapter = _session.get_adapter(settings.MODEL_SERVICE_URL)
+        pool = adapter.poolmanager.connection_from_url(settings.MODEL_SERVICE_URL)
+        free_slots = pool.pool.qsize() if pool.pool is not None else None
+    with _stats_lock:
+        return {
+            "pid": os.getpid(),
+            "pool_size": MODEL_SERVICE_POOL_SIZE,
+            "in_flight": _in_flight,
+            "free_slots": free_slots,
+            **_stats,
+            "kinds": {kind: dict(timing) for kind, timing in _kind_stats.items()},
+        }
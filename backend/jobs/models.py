@@ -29,6 +29,11 @@ class Job(models.Model):
     session_id = models.CharField(max_length=100, db_index=True, blank=True)
     user = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL, related_name="jobs")
 
+    #scheduling
+    priority = models.CharField(max_length=20, default='standard')
+    cost = models.FloatField(null=True, blank=True)
+    dispatched_at = models.DateTimeField(null=True, blank=True)
+
     def __str__(self):
         return f"Job {self.id} - {self.status} - {self.user} - {self.session_id} - {self.image}"
 
@@ -0,0 +1,177 @@
+import os
+import logging
+from collections import OrderedDict, defaultdict
+from datetime import timedelta
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# Jobs handed to Celery at once, the rest wait here so they can be reordered
+MAX_IN_FLIGHT = int(os.getenv("JOB_SCHEDULER_MAX_IN_FLIGHT", "2"))
+# How far back work already served to an owner counts against it
+FAIRNESS_WINDOW_SECONDS = int(os.getenv("JOB_SCHEDULER_FAIRNESS_WINDOW", "3600"))
+# Dispatched jobs that never reported back stop holding a slot after this long
+STALE_AFTER_SECONDS = int(os.getenv("JOB_SCHEDULER_STALE_SECONDS", "1800"))
+
+INTERACTIVE = "interactive"
+STANDARD = "standard"
+PRIORITY_RANK = {INTERACTIVE: 0, STANDARD: 1}
+
+# pg_advisory_xact_lock key serializing dispatch() across web and Celery processes
+DISPATCH_LOCK_ID = 0x6A6F6273
+
+QUEUED = "queued"
+IN_FLIGHT_STATUSES = ("pending", "processing", "progress")
+
+SEGMENTATION_PROMPT = "!auto_segmentation"
+BASE_PIXELS = 512 * 512
+DEFAULT_T2I_PIXELS = 768 * 1024
+
+
+def owner_key(job):
+    """Jobs are shared fairly per user, guests per session."""
+    return f"user:{job.user_id}" if job.user_id else f"session:{job.session_id}"
+
+
+def estimate_cost(job):
+    """Relative GPU cost: steps x passes x resolution in units of 512x512."""
+    if job.prompt == SEGMENTATION_PROMPT:
+        return 1.0
+
+    pixels = DEFAULT_T2I_PIXELS
+    if job.image:
+        try:
+            pixels = job.image.width * job.image.height
+        except Exception:
+            pass
+
+    steps = job.steps or 40
+    passes = (job.passes or 4) if job.image else 1
+    return steps * passes * pixels / BASE_PIXELS / 100.0
+
+
+def classify(job):
+    return INTERACTIVE if job.prompt == SEGMENTATION_PROMPT else STANDARD
+
+
+def _in_flight():
+    since = timezone.now() - timedelta(seconds=STALE_AFTER_SECONDS)
+    return Job.objects.filter(status__in=IN_FLIGHT_STATUSES, dispatched_at__gte=since).count()
+
+
+def enqueue(job):
+    """Queues a freshly created job with its priority and cost, then dispatches what fits."""
+    job.priority = classify(job)
+    job.cost = estimate_cost(job)
+    job.status = QUEUED
+    job.save(update_fields=["priority", "cost", "status"])
+    dispatch()
+
+
+def _served_costs():
+    since = timezone.now() - timedelta(seconds=FAIRNESS_WINDOW_SECONDS)
+    served = defaultdict(float)
+    rows = (
+        Job.objects.filter(dispatched_at__gte=since)
+        .values("user_id", "session_id")
+        .annotate(total=Sum("cost"))
+    )
+    for row in rows:
+        key = f"user:{row['user_id']}" if row["user_id"] else f"session:{row['session_id']}"
+        served[key] += row["total"] or 0.0
+    return served
+
+
+def queue_order(queued=None):
+    """
+    Orders queued jobs the way they will be dispatched: interactive work
+    first, then the owner with the least recently served cost, FIFO per owner
+    within a priority class.
+    """
+    if queued is None:
+        queued = list(Job.objects.filter(status=QUEUED).order_by("created_at", "id"))
+
+    lanes = OrderedDict()
+    for job in queued:
+        lanes.setdefault((PRIORITY_RANK.get(job.priority, 1), owner_key(job)), []).append(job)
+
+    served = _served_costs()
+    order = []
+    while lanes:
+        lane = min(lanes, key=lambda key: (key[0], served[key[1]], lanes[key][0].created_at))
+        job = lanes[lane].pop(0)
+        order.append(job)
+        served[lane[1]] += job.cost or 0.0
+        if not lanes[lane]:
+            del lanes[lane]
+    return order
+
+
+def _task_for(job):
+    from .tasks import process_job, generate_image, process_segmentation
+
+    if job.prompt == SEGMENTATION_PROMPT:
+        return process_segmentation
+    if job.image:
+        return process_job
+    return generate_image
+
+
+def _lock_dispatch():
+    """
+    Held until the surrounding transaction ends, so concurrent dispatch()
+    calls count free slots one after another and never exceed MAX_IN_FLIGHT.
+    """
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", [DISPATCH_LOCK_ID])
+
+
+def dispatch():
+    """Hands queued jobs to Celery until MAX_IN_FLIGHT jobs are running or waiting there."""
+    to_send = []
+    with transaction.atomic():
+        _lock_dispatch()
+        free = MAX_IN_FLIGHT - _in_flight()
+        if free <= 0:
+            return 0
+
+        queued = list(
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(status=QUEUED)
+            .order_by("created_at", "id")
+        )
+        now = timezone.now()
+        for job in queue_order(queued)[:free]:
+            job.status = "pending"
+            job.dispatched_at = now
+            job.save(update_fields=["status", "dispatched_at"])
+            to_send.append(job)
+
+    for job in to_send:
+        _task_for(job).delay(job.id)
+        logger.info(f"Dispatched job {job.id} ({job.priority}, cost {job.cost:.2f})")
+    return len(to_send)
+
+
+def queue_state(job_id=None):
+    """Queue depth per model and, for job_id, its current position (1 = next)."""
+    order = queue_order()
+    depth = defaultdict(int)
+    for job in order:
+        depth[job.model] += 1
+
+    state = {
+        "depth": len(order),
+        "depth_per_model": dict(depth),
+        "in_flight": _in_flight(),
+        "max_in_flight": MAX_IN_FLIGHT,
+    }
+    if job_id is not None:
+        ids = [job.id for job in order]
+        state["job_id"] = job_id
+        state["position"] = ids.index(job_id) + 1 if job_id in ids else None
+    return state
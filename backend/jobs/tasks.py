@@ -6,12 +6,15 @@ from celery import shared_task
 from django.conf import settings
 from asgiref.sync import async_to_sync
 from channels.layers import get_channel_layer
-from PIL import Image as PILImage
-import numpy as np
 
 from .models import Job, JobEvent
 from .serializers import JobSerializer
 from .session_history import add_event
+from .job_sessions import forget_job_session, FINISHED_STATUSES
+from .mask_codec import RLE_FORMAT
+from . import mask_store
+from . import model_service_client
+from . import scheduler
 
 logger = logging.getLogger(__name__)
 
@@ -20,10 +23,14 @@ from dotenv import load_dotenv
 load_dotenv()
 
 # Configuration
+# How inputs reach the model service: "path" (shared media volume), "multipart"
+# (uploads) or "auto" (paths, switching to uploads if the service cannot see them)
+MEDIA_TRANSPORT = os.getenv("MEDIA_TRANSPORT", "auto")
+# Learned in auto mode, None until the first request with media
+_shared_media = None
 BASE_MEDIA_ROOT = os.getenv("MEDIA_ROOT", "/data/media")
 MEDIA_ROOT = os.path.join(BASE_MEDIA_ROOT, "outputs")
 MEDIA_URL = "/media/"
-MASKS_DIR = os.path.join(MEDIA_ROOT, "masks")
 
 
 def send_progress(session_id, event_type, **kwargs):
@@ -42,18 +49,49 @@ def send_progress(session_id, event_type, **kwargs):
         logger.error(f"Failed to send progress update: {str(e)}")
 
 
-def update_job_status(job, status, session_id=None, **kwargs):
-    """Update job status, save event, and broadcast progress."""
-    job.status = status
+# Statuses a task may still move its job out of, anything else (a cancel) wins
+RUNNING_STATUSES = (scheduler.QUEUED,) + scheduler.IN_FLIGHT_STATUSES
+
+
+def update_job_status(job, status, session_id=None, from_statuses=None, **kwargs):
+    """
+    Update job status, save event, and broadcast progress. With from_statuses
+    the row is only changed while its status is still one of them, so a
+    concurrent cancel is never overwritten. Returns whether the update applied.
+    """
+    fields = {"status": status}
     if 'masks' in kwargs:
-        job.masks = kwargs['masks']
-    job.save()
+        fields["masks"] = kwargs['masks']
+    if from_statuses is not None:
+        if not Job.objects.filter(pk=job.pk, status__in=from_statuses).update(**fields):
+            return False
+        for name, value in fields.items():
+            setattr(job, name, value)
+    else:
+        for name, value in fields.items():
+            setattr(job, name, value)
+        job.save()
 
     JobEvent.objects.create(job=job, type=status, payload=kwargs)
 
+    if status in FINISHED_STATUSES:
+        forget_job_session(job.id)
+        # a slot was freed, hand the next queued job to Celery
+        scheduler.dispatch()
+
     if session_id:
         send_progress(session_id, status, job_id=job.id, **kwargs)
         add_event(session_id, {"type": status, "job_id": job.id, **kwargs})
+    return True
+
+
+@shared_task
+def dispatch_queued():
+    """
+    Periodic dispatch (celery beat), dispatch() otherwise only runs when a job
+    is created or finishes, so a queue waiting on stale in-flight jobs would never drain.
+    """
+    return scheduler.dispatch()
 
 
 def format_output_url(file_path):
@@ -88,27 +126,23 @@ def format_output_url(file_path):
 
 
 def save_masks_as_pngs(masks, job_id):
-    """Save segmentation masks as transparent PNGs."""
-    os.makedirs(MASKS_DIR, exist_ok=True)
-    mask_paths = []
+    """
+    Persists segmentation masks as one bit-packed artifact plus metadata and
+    returns the per-mask transparent PNG URLs. In lazy mode the URLs point at
+    an endpoint that renders each PNG from the artifact on first request.
+    """
+    stack, _ = mask_store.save_masks(masks, job_id)
 
-    for i, mask_dict in enumerate(masks):
-        mask_array = np.array(mask_dict['segmentation'], dtype=np.float32)
-        img = PILImage.fromarray((mask_array * 255).astype(np.uint8))
-        img = img.convert("L")
-        rgba = PILImage.new("RGBA", img.size, (0, 0, 0, 0))
-        rgba.putalpha(img)
-        mask_path = os.path.join(MASKS_DIR, f"job_{job_id}_mask_{i}.png")
-        rgba.save(mask_path)
-        mask_paths.append(format_output_url(mask_path))
+    if mask_store.MASK_PNG_MODE == "lazy":
+        return [f"/api/masks/{job_id}/{i}.png" for i in range(len(stack))]
 
-    return mask_paths
+    return [format_output_url(path) for path in mask_store.write_pngs(stack, job_id)]
 
 
-def post_request_with_files(url, data=None, files=None, timeout=120):
-    """Make POST request with files and data, handle errors."""
+def post_request_with_files(path, data=None, files=None, kind="inference"):
+    """Make POST request with files and data to the model service, handle errors."""
     try:
-        response = requests.post(url, data=data, files=files, timeout=timeout)
+        response = model_service_client.post(path, kind, data=data, files=files)
         response.raise_for_status()
         return response.json()
     except requests.HTTPError as e:
@@ -119,43 +153,96 @@ def post_request_with_files(url, data=None, files=None, timeout=120):
         raise
 
 
-def prepare_files_for_job(job):
+def media_relative_path(path):
+    """Normalizes a path (absolute or relative to MEDIA_ROOT) to MEDIA_ROOT-relative, refusing anything outside it."""
+    media_root = os.path.realpath(settings.MEDIA_ROOT)
+    full_path = os.path.realpath(os.path.join(media_root, path))
+    if os.path.commonpath([media_root, full_path]) != media_root:
+        raise ValueError(f"Path {path} is outside MEDIA_ROOT")
+    return os.path.relpath(full_path, media_root).replace("\\", "/")
+
+
+def job_media(job):
+    """MEDIA_ROOT-relative paths of the job's input files, by request field name."""
+    media = {}
+    if job.image:
+        media["image"] = job.image.name
+    if job.mask:
+        media["mask"] = job.mask.name
+    return media
+
+
+def open_media_files(media):
     """Prepare file payloads for upload."""
     files = {}
     handles = []
-
-    def open_file(field, name):
-        f = field.open('rb')
-        filename = os.path.basename(field.name)
-        files[name] = (filename, f, 'image/png')
-        handles.append(f)
-        return f
-
     try:
-        if job.image:
-            open_file(job.image, "image")
-        if job.mask:
-            open_file(job.mask, "mask")
+        for name, path in media.items():
+            f = open(os.path.join(settings.MEDIA_ROOT, path), 'rb')
+            files[name] = (os.path.basename(path), f, 'image/png')
+            handles.append(f)
         return files, handles
     except Exception as e:
+        for f in handles:
+            f.close()
         logger.error(f"Failed to open file: {str(e)}")
         raise
 
 
+def _is_missing_media(error):
+    response = error.response
+    return response is not None and response.status_code == 404 and "Media path" in response.text
+
+
+def post_request_with_media(path, data=None, media=None, kind="inference"):
+    """
+    POSTs data plus media files given as MEDIA_ROOT-relative paths. With a
+    shared media volume only the paths are sent (as <name>_path fields) and the
+    model service reads the files itself, otherwise the files are uploaded.
+    """
+    global _shared_media
+    data = dict(data or {})
+    media = {name: media_relative_path(file_path) for name, file_path in (media or {}).items()}
+
+    if media and MEDIA_TRANSPORT != "multipart" and _shared_media is not False:
+        paths = {f"{name}_path": file_path for name, file_path in media.items()}
+        try:
+            result = post_request_with_files(path, data={**data, **paths}, kind=kind)
+            _shared_media = True
+            return result
+        except requests.HTTPError as e:
+            if MEDIA_TRANSPORT == "path" or _shared_media or not _is_missing_media(e):
+                raise
+            logger.warning("Model service cannot read the media volume, uploading files instead")
+            _shared_media = False
+
+    files, handles = open_media_files(media)
+    try:
+        return post_request_with_files(path, data=data, files=files or None, kind=kind)
+    finally:
+        for f in handles:
+            try:
+                f.close()
+            except Exception as e:
+                logger.error(f"Error closing file: {str(e)}")
+
+
+def is_cancelled(job_id):
+    """True when the job was cancelled through the API, checked before and after model calls."""
+    return Job.objects.filter(id=job_id, status="cancelled").exists()
+
+
 def upscale_image(output_image_path, model):
     """Upscale image via model service."""
     if not os.path.exists(output_image_path):
         raise FileNotFoundError(f"Output file not found: {output_image_path}")
 
-    with open(output_image_path, 'rb') as f:
-        files = {'image': (os.path.basename(output_image_path), f, 'image/png')}
-        data = {"model": model}
-        return post_request_with_files(
-            f"{settings.MODEL_SERVICE_URL}/upscale",
-            data=data,
-            files=files,
-            timeout=300
-        )
+    return post_request_with_media(
+        "/upscale",
+        data={"model": model},
+        media={"image": output_image_path},
+        kind="upscale"
+    )
 
 
 def handle_output_and_upscale(job, output_url, progress_step=0.99):
@@ -168,19 +255,30 @@ def handle_output_and_upscale(job, output_url, progress_step=0.99):
 
     output_image_path = os.path.join(settings.MEDIA_ROOT, job.output.name)
 
+    # a cancel may have arrived while the model service was running
+    if is_cancelled(job.id):
+        logger.info(f"Job {job.id} was cancelled, not publishing its output")
+        return
+
     # Broadcast preview
-    update_job_status(
+    if not update_job_status(
         job,
         "progress",
         job.session_id,
+        from_statuses=RUNNING_STATUSES,
         preview_url=formatted_url,
         progress=progress_step
-    )
+    ):
+        logger.info(f"Job {job.id} was cancelled, not publishing its output")
+        return
     send_progress(job.session_id, "upscaling", job_id=job.id, progress=progress_step, preview_url=formatted_url)
 
     # Upscale if needed
     upscaled_output_url = formatted_url
     if job.upscale_model:
+        if is_cancelled(job.id):
+            logger.info(f"Job {job.id} was cancelled before upscaling")
+            return
         try:
             upscale_result = upscale_image(output_image_path, job.upscale_model)
             upscaled_output_url = format_output_url(upscale_result.get("output_url"))
@@ -190,16 +288,23 @@ def handle_output_and_upscale(job, output_url, progress_step=0.99):
         except Exception as e:
             logger.warning(f"Upscaling failed, falling back to original: {str(e)}")
 
+    if is_cancelled(job.id):
+        logger.info(f"Job {job.id} was cancelled during upscaling")
+        return
+
     # Finalize
     serializer = JobSerializer(job)
-    update_job_status(
+    if not update_job_status(
         job,
         "done",
         job.session_id,
+        from_statuses=RUNNING_STATUSES,
         preview_url=upscaled_output_url,
         progress=1,
         job_data=serializer.data
-    )
+    ):
+        logger.info(f"Job {job.id} was cancelled during upscaling")
+        return
     send_progress(job.session_id, "done", job_id=job.id, progress=1)
     logger.info(f"Processing completed for job {job.id}")
 
@@ -209,64 +314,67 @@ def process_job(self, job_id):
     """Process an image with optional mask and upscaling."""
     try:
         job = Job.objects.get(id=job_id)
+        if job.status == "cancelled":
+            logger.info(f"Skipping cancelled job {job_id}")
+            return
         logger.info(f"Starting processing for job {job_id}")
-        update_job_status(job, 'processing', job.session_id)
+        if not update_job_status(job, 'processing', job.session_id, from_statuses=RUNNING_STATUSES):
+            logger.info(f"Skipping cancelled job {job_id}")
+            return
         send_progress(job.session_id, "created", job_id=job.id)
 
-        files, handles = {}, []
-        try:
-            files, handles = prepare_files_for_job(job)
-            send_progress(job.session_id, "progress", job_id=job.id, progress=20)
-
-            data = {
-                "prompt": job.prompt,
-                "negative_prompt": job.negative_prompt,
-                "job_id": job.id,
-                "model": job.model,
-                "strength": job.strength,
-                "guidance_scale": job.guidance_scale,
-                "steps": job.steps,
-                "passes": job.passes,
-                "seed": job.seed,
-                "finish_model": job.finish_model,
-            }
-            data = {k: v for k, v in data.items() if v is not None}
+        send_progress(job.session_id, "progress", job_id=job.id, progress=20)
 
-            result = post_request_with_files(
-                f"{settings.MODEL_SERVICE_URL}/process-image",
-                data=data,
-                files=files,
-                timeout=120
-            )
+        data = {
+            "prompt": job.prompt,
+            "negative_prompt": job.negative_prompt,
+            "job_id": job.id,
+            "model": job.model,
+            "strength": job.strength,
+            "guidance_scale": job.guidance_scale,
+            "steps": job.steps,
+            "passes": job.passes,
+            "seed": job.seed,
+            "finish_model": job.finish_model,
+        }
+        data = {k: v for k, v in data.items() if v is not None}
 
-            output_url = result.get("output_url")
-            if not output_url:
-                raise ValueError("Missing output_url in response")
+        result = post_request_with_media(
+            "/process-image",
+            data=data,
+            media=job_media(job),
+        )
 
-            handle_output_and_upscale(job, output_url, progress_step=0.99)
+        output_url = result.get("output_url")
+        if not output_url:
+            raise ValueError("Missing output_url in response")
 
-        finally:
-            for f in handles:
-                try:
-                    f.close()
-                except Exception as e:
-                    logger.error(f"Error closing file: {str(e)}")
+        handle_output_and_upscale(job, output_url, progress_step=0.99)
 
-    except (IOError, OSError) as e:
-        logger.error(f"File error: {str(e)}")
-        update_job_status(job, "failed", job.session_id)
-        raise
     except requests.RequestException as e:
+        # before the file errors below, RequestException is an IOError too
+        if is_cancelled(job_id):
+            logger.info(f"Job {job_id} was cancelled")
+            return
         logger.error(f"API error: {str(e)}")
-        update_job_status(job, "failed", job.session_id)
+        if self.request.retries >= self.max_retries:
+            update_job_status(job, "failed", job.session_id, from_statuses=RUNNING_STATUSES)
+            raise
+        # still running until the last retry, the job keeps its scheduler slot
         raise self.retry(exc=e, countdown=60)
+    except (IOError, OSError) as e:
+        logger.error(f"File error: {str(e)}")
+        update_job_status(job, "failed", job.session_id, from_statuses=RUNNING_STATUSES)
+        raise
     except Exception as e:
         logger.error(f"Processing error: {str(e)}")
         if not Job.objects.filter(id=job_id).exists():
             logger.error(f"Job {job_id} does not exist")
             return
         job.refresh_from_db()
-        update_job_status(job, "failed", job.session_id)
+        if job.status == "cancelled":
+            return
+        update_job_status(job, "failed", job.session_id, from_statuses=RUNNING_STATUSES)
         raise
 
 
@@ -275,8 +383,13 @@ def generate_image(self, job_id):
     """Generate image from prompt and optionally upscale."""
     try:
         job = Job.objects.get(id=job_id)
+        if job.status == "cancelled":
+            logger.info(f"Skipping cancelled job {job_id}")
+            return
         logger.info(f"Starting image generation for job {job_id}")
-        update_job_status(job, 'processing', job.session_id)
+        if not update_job_status(job, 'processing', job.session_id, from_statuses=RUNNING_STATUSES):
+            logger.info(f"Skipping cancelled job {job_id}")
+            return
         send_progress(job.session_id, "created", job_id=job.id)
 
         data = {
@@ -291,9 +404,8 @@ def generate_image(self, job_id):
         data = {k: v for k, v in data.items() if v is not None}
 
         result = post_request_with_files(
-            f"{settings.MODEL_SERVICE_URL}/generate-image",
+            "/generate-image",
             data=data,
-            timeout=120
         )
 
         output_url = result.get("output_url")
@@ -303,8 +415,14 @@ def generate_image(self, job_id):
         handle_output_and_upscale(job, output_url, progress_step=0.99)
 
     except requests.RequestException as e:
+        if is_cancelled(job_id):
+            logger.info(f"Job {job_id} was cancelled")
+            return
         logger.error(f"API error: {str(e)}")
-        update_job_status(job, "failed", job.session_id)
+        if self.request.retries >= self.max_retries:
+            update_job_status(job, "failed", job.session_id, from_statuses=RUNNING_STATUSES)
+            raise
+        # still running until the last retry, the job keeps its scheduler slot
         raise self.retry(exc=e, countdown=60)
     except Exception as e:
         logger.error(f"Generation error: {str(e)}")
@@ -312,7 +430,9 @@ def generate_image(self, job_id):
             logger.error(f"Job {job_id} does not exist")
             return
         job.refresh_from_db()
-        update_job_status(job, "failed", job.session_id)
+        if job.status == "cancelled":
+            return
+        update_job_status(job, "failed", job.session_id, from_statuses=RUNNING_STATUSES)
         raise
 
 
@@ -321,39 +441,49 @@ def process_segmentation(self, job_id):
     """Run auto-segmentation and save masks."""
     try:
         job = Job.objects.get(id=job_id)
+        if job.status == "cancelled":
+            logger.info(f"Skipping cancelled job {job_id}")
+            return
         logger.info(f"Starting segmentation for job {job_id}")
-        update_job_status(job, "processing", job.session_id)
+        if not update_job_status(job, "processing", job.session_id, from_statuses=RUNNING_STATUSES):
+            logger.info(f"Skipping cancelled job {job_id}")
+            return
 
-        files, handles = {}, []
-        try:
-            files, handles = prepare_files_for_job(job)
-            data = {"model": job.model, "job_id": job_id}
-
-            result = post_request_with_files(
-                f"{settings.MODEL_SERVICE_URL}/auto_segmentation",
-                data=data,
-                files=files,
-                timeout=120
-            )
-
-            masks = result.get("masks")
-            if not masks:
-                raise ValueError("Missing masks in response")
-
-            mask_paths = save_masks_as_pngs(masks, job_id)
-            update_job_status(job, "done", job.session_id, masks=mask_paths)
-            return mask_paths
-
-        finally:
-            for f in handles:
-                try:
-                    f.close()
-                except Exception as e:
-                    logger.error(f"Error closing file: {str(e)}")
+        data = {"model": job.model, "job_id": job_id, "mask_format": RLE_FORMAT}
+
+        result = post_request_with_media(
+            "/auto_segmentation",
+            data=data,
+            media=job_media(job),
+        )
+
+        masks = result.get("masks")
+        if not masks:
+            raise ValueError("Missing masks in response")
+
+        mask_paths = save_masks_as_pngs(masks, job_id)
+        if is_cancelled(job_id):
+            logger.info(f"Job {job_id} was cancelled")
+            return
+        if not update_job_status(
+            job, "done", job.session_id,
+            from_statuses=RUNNING_STATUSES,
+            masks=mask_paths,
+            mask_metadata=format_output_url(mask_store.metadata_path(job_id)),
+        ):
+            logger.info(f"Job {job_id} was cancelled")
+            return
+        return mask_paths
 
     except requests.RequestException as e:
+        if is_cancelled(job_id):
+            logger.info(f"Job {job_id} was cancelled")
+            return
         logger.error(f"API error: {str(e)}")
-        update_job_status(job, "failed", job.session_id)
+        if self.request.retries >= self.max_retries:
+            update_job_status(job, "failed", job.session_id, from_statuses=RUNNING_STATUSES)
+            raise
+        # still running until the last retry, the job keeps its scheduler slot
         raise self.retry(exc=e, countdown=60)
     except Exception as e:
         logger.error(f"Segmentation error: {str(e)}")
@@ -361,5 +491,7 @@ def process_segmentation(self, job_id):
             logger.error(f"Job {job_id} does not exist")
             return
         job.refresh_from_db()
-        update_job_status(job, "failed", job.session_id)
+        if job.status == "cancelled":
+            return
+        update_job_status(job, "failed", job.session_id, from_statuses=RUNNING_STATUSES)
         raise
\ No newline at end of file
@@ -1,3 +1,176 @@
-from django.test import TestCase
+import os
+import tempfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import requests
+from celery.exceptions import Retry
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+from PIL import Image
+
+from . import mask_store, scheduler, tasks
+from .models import Job
+
+
+class SchedulerTestCase(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="alice", password="secret")
+        self.start = timezone.now() - timedelta(minutes=10)
+        self.created = 0
+        self.task = mock.Mock()
+        patcher = mock.patch.object(scheduler, "_task_for", return_value=self.task)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_job(self, user=None, session_id="guest", prompt="a cat", status=scheduler.QUEUED, cost=1.0):
+        job = Job.objects.create(prompt=prompt, user=user, session_id=session_id, status=status, cost=cost)
+        if prompt == scheduler.SEGMENTATION_PROMPT:
+            job.priority = scheduler.INTERACTIVE
+            job.save(update_fields=["priority"])
+        # distinct creation times so FIFO order within an owner is well defined
+        self.created += 1
+        Job.objects.filter(pk=job.pk).update(created_at=self.start + timedelta(seconds=self.created))
+        job.refresh_from_db()
+        return job
+
+
+class QueueOrderTests(SchedulerTestCase):
+    def test_interleaves_users_and_sessions(self):
+        a1 = self.make_job(user=self.user, session_id="tab-1")
+        a2 = self.make_job(user=self.user, session_id="tab-2")
+        a3 = self.make_job(user=self.user, session_id="tab-1")
+        g1 = self.make_job(session_id="guest")
+        g2 = self.make_job(session_id="guest")
+
+        self.assertEqual(scheduler.queue_order(), [a1, g1, a2, g2, a3])
+
+    def test_owner_with_less_served_cost_goes_first(self):
+        served = self.make_job(session_id="busy", status="done", cost=50.0)
+        Job.objects.filter(pk=served.pk).update(dispatched_at=timezone.now())
+        busy = self.make_job(session_id="busy")
+        idle = self.make_job(session_id="idle")
+
+        self.assertEqual(scheduler.queue_order(), [idle, busy])
+
+    def test_interactive_jobs_go_first(self):
+        standard = self.make_job(session_id="guest")
+        interactive = self.make_job(session_id="other", prompt=scheduler.SEGMENTATION_PROMPT)
+
+        self.assertEqual(scheduler.queue_order(), [interactive, standard])
+
+
+@mock.patch.object(scheduler, "MAX_IN_FLIGHT", 2)
+class DispatchTests(SchedulerTestCase):
+    def test_respects_in_flight_cap(self):
+        jobs = [self.make_job(session_id=f"s{i}") for i in range(3)]
+
+        self.assertEqual(scheduler.dispatch(), 2)
+        self.assertEqual(scheduler.dispatch(), 0)
+
+        statuses = [Job.objects.get(pk=job.pk).status for job in jobs]
+        self.assertEqual(statuses, ["pending", "pending", scheduler.QUEUED])
+        self.assertEqual(self.task.delay.call_count, 2)
+
+    def test_finished_job_frees_its_slot(self):
+        for status in ("done", "failed", "cancelled"):
+            with self.subTest(status=status):
+                Job.objects.all().delete()
+                running = [self.make_job(session_id=f"s{i}") for i in range(2)]
+                waiting = self.make_job(session_id="s2")
+                scheduler.dispatch()
+
+                tasks.update_job_status(Job.objects.get(pk=running[0].pk), status)
+
+                self.assertEqual(Job.objects.get(pk=waiting.pk).status, "pending")
+
+    def test_stale_jobs_stop_holding_slots(self):
+        stale_at = timezone.now() - timedelta(seconds=scheduler.STALE_AFTER_SECONDS + 60)
+        for i in range(2):
+            stale = self.make_job(session_id=f"stale{i}", status="pending")
+            Job.objects.filter(pk=stale.pk).update(dispatched_at=stale_at)
+        waiting = self.make_job(session_id="guest")
+
+        tasks.dispatch_queued()
+
+        self.assertEqual(Job.objects.get(pk=waiting.pk).status, "pending")
+
+    @mock.patch.object(tasks, "send_progress")
+    @mock.patch.object(tasks, "post_request_with_media", side_effect=requests.ConnectionError("down"))
+    def test_request_retry_keeps_its_slot(self, post, send_progress):
+        first = self.make_job(session_id="s0")
+        self.make_job(session_id="s1")
+        waiting = self.make_job(session_id="s2")
+        scheduler.dispatch()
+
+        with mock.patch.object(tasks.process_job, "retry", side_effect=Retry()):
+            with self.assertRaises(Retry):
+                tasks.process_job(first.id)
+
+        self.assertEqual(Job.objects.get(pk=first.pk).status, "processing")
+        self.assertEqual(scheduler.dispatch(), 0)
+        self.assertEqual(Job.objects.get(pk=waiting.pk).status, scheduler.QUEUED)
+
+
+def encode_rle(mask):
+    """Same encoding as model_service/services/mask_codec.py."""
+    height, width = mask.shape
+    flat = mask.ravel(order="F")
+    changes = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    counts = np.diff(np.concatenate(([0], changes, [flat.size])))
+    if flat[0]:
+        counts = np.concatenate(([0], counts))
+    return {"size": [height, width], "counts": counts.tolist()}
+
+
+class MaskStoreTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        patcher = mock.patch.object(mask_store, "MASKS_DIR", tmp.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        # odd sizes so bit-packing has a partial last byte, one mask starts with foreground
+        rng = np.random.default_rng(0)
+        self.stack = rng.random((3, 13, 7)) > 0.5
+        self.stack[1, 0, 0] = True
+        self.masks = [
+            {"segmentation": encode_rle(mask), "bbox": [0, 0, 7, 13], "predicted_iou": 0.9}
+            for mask in self.stack
+        ]
+
+    def test_stack_masks_decodes_rle(self):
+        np.testing.assert_array_equal(mask_store.stack_masks(self.masks), self.stack)
+
+    def test_stack_masks_accepts_legacy_lists(self):
+        legacy = [{"segmentation": mask.astype(int).tolist()} for mask in self.stack]
+        np.testing.assert_array_equal(mask_store.stack_masks(legacy), self.stack)
+
+    def test_round_trip_through_artifact_and_png(self):
+        _, metadata = mask_store.save_masks(self.masks, job_id=1)
+
+        self.assertEqual(metadata["size"], [13, 7])
+        self.assertEqual([m["area"] for m in metadata["masks"]], self.stack.reshape(3, -1).sum(axis=1).tolist())
+        self.assertEqual(mask_store.load_metadata(1), metadata)
+
+        for index, mask in enumerate(self.stack):
+            np.testing.assert_array_equal(mask_store.load_mask(1, index), mask)
+            path = mask_store.render_png(1, index)
+            with Image.open(path) as image:
+                alpha = np.asarray(image.convert("RGBA"))[..., 3]
+            np.testing.assert_array_equal(alpha, mask * 255)
+
+        with self.assertRaises(IndexError):
+            mask_store.load_mask(1, 3)
+
+    def test_eager_pngs_match_lazy_render(self):
+        stack, _ = mask_store.save_masks(self.masks, job_id=2)
+        paths = mask_store.write_pngs(stack, job_id=2)
+
+        self.assertEqual(paths, [mask_store.png_path(2, i) for i in range(3)])
+        for index, path in enumerate(paths):
+            self.assertTrue(os.path.exists(path))
+            self.assertEqual(mask_store.render_png(2, index), path)
@@ -2,9 +2,16 @@ from django.urls import path, include
 from .views import (
     CreateJobView, 
     job_progress, 
+    job_progress_batch,
+    cancel_job,
+    queue_status,
+    model_service_stats,
     get_models, 
     get_masks, 
     get_masks_status, 
+    get_mask_metadata,
+    get_mask_png,
+    segment_with_prompts,
     get_t2i_models, 
     get_upscalers,
     session_history,
@@ -22,12 +29,19 @@ router.register(r'my-gallery', GalleryViewSet, basename='my-gallery')
 
 urlpatterns = [
     path('jobs', CreateJobView.as_view(), name='create_job'),
+    path('jobs/<int:job_id>/cancel', cancel_job, name='cancel_job'),
     path('api/job-progress/', job_progress, name='job_progress'),
+    path('api/job-progress/batch/', job_progress_batch, name='job_progress_batch'),
+    path('api/queue/', queue_status, name='queue_status'),
+    path('api/model-service/stats/', model_service_stats, name='model_service_stats'),
     path('api/models/', get_models, name='get_models'),
     path('api/t2i-models/', get_t2i_models, name='get_t2i-models'),
     path('api/upscalers/', get_upscalers, name='get_upscalers'),
     path('api/get_masks', get_masks, name='get_masks'),               
     path('api/get_masks_status/<int:job_id>', get_masks_status, name='get_masks_status'),  
+    path('api/masks/<int:job_id>', get_mask_metadata, name='get_mask_metadata'),
+    path('api/masks/<int:job_id>/<int:index>.png', get_mask_png, name='get_mask_png'),
+    path('api/segment', segment_with_prompts, name='segment_with_prompts'),
     path("history", session_history),
     path("history/clear", clear_session_history_view),
     path("jobs/claim", claim_session_jobs),
@@ -3,8 +3,9 @@ from rest_framework import views, viewsets
 from .serializers import GalleryJobSerializer
 from rest_framework.response import Response
 from rest_framework import status
-from .tasks import process_job, send_progress, process_segmentation, generate_image
+from .tasks import send_progress, update_job_status
 from .models import Job
+import json
 import logging
 from rest_framework.decorators import api_view
 import requests
@@ -14,6 +15,12 @@ from rest_framework.decorators import api_view, permission_classes, authenticati
 from .session_history import get_history, clear_history
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from .permissions import IsOwnerOrGuest
+from .job_sessions import remember_job_session, get_job_session, FINISHED_STATUSES
+from . import scheduler
+from .mask_codec import RLE_FORMAT
+from . import mask_store
+from . import model_service_client
+from django.http import FileResponse
 
 
 class CreateJobView(views.APIView):
@@ -59,19 +66,13 @@ class CreateJobView(views.APIView):
             upscale_model=upscaler_model,
         )
         add_event(session_id, {"type": "created", "job_id": job.id, "model": job.model})
+        remember_job_session(job.id, session_id)
 
         logging.info(f"Created job with ID: {job.id} for session: {session_id}")
 
-        if image:
-            process_job.delay(
-                job.id
-            )
-        else:
-            generate_image.delay(
-                job.id
-            )
+        scheduler.enqueue(job)
 
-        logging.info(f"Started processing job with ID: {job.id}")
+        logging.info(f"Queued job with ID: {job.id}")
         return Response({"job_id": job.id, "status": job.status})
 
     
@@ -86,8 +87,8 @@ def job_progress(request):
     if not event:
         event = "progress"
 
-    job = Job.objects.filter(id=job_id).first()
-    if not job:
+    session_id = get_job_session(job_id)
+    if not session_id:
         return Response({"error": "Job not found."}, status=status.HTTP_404_NOT_FOUND)
     
     kwargs = {}
@@ -95,24 +96,112 @@ def job_progress(request):
     if output_url:
         kwargs['preview_url'] = output_url
 
-    send_progress(job.session_id, event, job_id=job.id, progress=progress, **kwargs)
+    send_progress(session_id, event, job_id=int(job_id), progress=progress, **kwargs)
 
     return Response({"message": "Progress updated successfully."}, status=status.HTTP_200_OK)
 
+@api_view(['POST'])
+def job_progress_batch(request):
+    """
+    Coalesced progress from the model service: {"updates": [{job_id, progress, event, output_url?}, ...]}.
+    Sessions are resolved from the cache, unknown jobs are skipped.
+    """
+    updates = request.data.get('updates') or []
+    sent = 0
+
+    for update in updates:
+        job_id = update.get('job_id')
+        session_id = get_job_session(job_id) if job_id is not None else None
+        if not session_id:
+            continue
+
+        kwargs = {}
+        if update.get('output_url'):
+            kwargs['preview_url'] = update['output_url']
+        if update.get('preview'):
+            # small data-URL thumbnail of the latents mid-denoising
+            kwargs['latent_preview'] = update['preview']
+
+        send_progress(
+            session_id,
+            update.get('event') or "progress",
+            job_id=int(job_id),
+            progress=update.get('progress'),
+            **kwargs
+        )
+        sent += 1
+
+    return Response({"sent": sent, "skipped": len(updates) - sent}, status=status.HTTP_200_OK)
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def cancel_job(request, job_id):
+    """
+    Marks a job as cancelled. Queued tasks skip it, a running one is stopped
+    by the model service after its current denoising step.
+    """
+    job = Job.objects.filter(id=job_id).first()
+    if not job:
+        return Response({"error": "Job not found."}, status=status.HTTP_404_NOT_FOUND)
+
+    session_id = request.headers.get("X-Session-ID")
+    allowed = (request.user.is_authenticated and job.user == request.user) or (
+        bool(session_id) and job.session_id == session_id
+    )
+    if not allowed:
+        return Response({"error": "Not allowed."}, status=status.HTTP_403_FORBIDDEN)
+
+    if job.status in FINISHED_STATUSES:
+        return Response({"error": f"Job is already {job.status}."}, status=status.HTTP_409_CONFLICT)
+
+    update_job_status(job, "cancelled", job.session_id)
+
+    try:
+        model_service_client.post(f"/jobs/{job.id}/cancel", kind="control")
+    except requests.RequestException as e:
+        logging.warning(f"Could not forward cancel of job {job.id} to the model service: {e}")
+
+    return Response({"job_id": job.id, "status": job.status})
+
+@api_view(['GET'])
+def queue_status(request):
+    """Scheduler queue depth per model, with the position of ?job_id= if given."""
+    job_id = request.query_params.get('job_id')
+    try:
+        job_id = int(job_id) if job_id else None
+    except ValueError:
+        return Response({"error": "job_id must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+    # clients poll this while waiting, hand over jobs whose slots were freed by stale ones
+    scheduler.dispatch()
+    return Response(scheduler.queue_state(job_id))
+
+@api_view(['GET'])
+def model_service_stats(request):
+    """Connection pool usage of the backend -> model service client in this process."""
+    return Response(model_service_client.client_stats())
+
+def _proxy_response(response):
+    """Relays a model service answer, non-JSON errors (proxy HTML pages, plain text) as {"error": text}."""
+    try:
+        payload = response.json()
+    except ValueError:
+        payload = {"error": response.text}
+    return Response(payload, status=response.status_code)
+
 @api_view(['GET'])
 def get_models(request):
-    models = requests.get(f"{settings.MODEL_SERVICE_URL}/models")
-    return Response(models.json(), status=models.status_code)
+    models = model_service_client.get("/models")
+    return _proxy_response(models)
 
 @api_view(['GET'])
 def get_t2i_models(request):
-    models = requests.get(f"{settings.MODEL_SERVICE_URL}/t2i-models")
-    return Response(models.json(), status=models.status_code)
+    models = model_service_client.get("/t2i-models")
+    return _proxy_response(models)
 
 @api_view(['GET'])
 def get_upscalers(request):
-    upscalers = requests.get(f"{settings.MODEL_SERVICE_URL}/upscalers")
-    return Response(upscalers.json(), status=upscalers.status_code)
+    upscalers = model_service_client.get("/upscalers")
+    return _proxy_response(upscalers)
 
 
 @api_view(['POST'])
@@ -137,12 +226,45 @@ def get_masks(request):
         model=model
     )
     add_event(session_id, {"type": "created", "job_id": job.id, "model": job.model})
+    remember_job_session(job.id, session_id)
 
-
-    process_segmentation.delay(job.id)
+    scheduler.enqueue(job)
 
     return Response({"job_id": job.id, "status": "processing"}, status=202)
 
+@api_view(['POST'])
+def segment_with_prompts(request):
+    """
+    Interactive point/box segmentation, proxied straight to the model service
+    without a job so every click costs only SAM's mask decoder.
+    """
+    data = {
+        key: request.data.get(key)
+        for key in ("model", "image_id", "points", "labels", "box", "multimask_output")
+        if request.data.get(key) is not None
+    }
+    # a JSON body carries these as lists, the model service expects JSON form fields
+    for key in ("points", "labels", "box"):
+        if key in data and not isinstance(data[key], str):
+            data[key] = json.dumps(data[key])
+    if isinstance(data.get("multimask_output"), bool):
+        data["multimask_output"] = "true" if data["multimask_output"] else "false"
+    data.setdefault("model", "sam-vit-h")
+    data["mask_format"] = RLE_FORMAT
+
+    files = {}
+    image = request.FILES.get('image')
+    if image:
+        files["image"] = (image.name, image.read(), image.content_type or "image/png")
+    elif not data.get("image_id"):
+        return Response({"error": "Image or image_id is required."}, status=400)
+
+    try:
+        response = model_service_client.post("/segment", kind="interactive", data=data, files=files or None)
+    except requests.RequestException as e:
+        return Response({"error": f"Model service unavailable: {e}"}, status=status.HTTP_502_BAD_GATEWAY)
+    return _proxy_response(response)
+
 @api_view(['GET'])
 def get_masks_status(request, job_id):
     try:
@@ -154,6 +276,25 @@ def get_masks_status(request, job_id):
         return Response({"status": "done", "masks": job.masks})
     else:
         return Response({"status": "processing"}, status=202)
+
+
+@api_view(['GET'])
+def get_mask_metadata(request, job_id):
+    """bbox, area and scores of every mask of a segmentation job."""
+    try:
+        return Response(mask_store.load_metadata(job_id))
+    except FileNotFoundError:
+        return Response({"error": "Masks not found"}, status=404)
+
+
+@api_view(['GET'])
+def get_mask_png(request, job_id, index):
+    """Per-mask PNG, rendered from the job's mask artifact on first request."""
+    try:
+        path = mask_store.render_png(job_id, index)
+    except (FileNotFoundError, IndexError):
+        return Response({"error": "Mask not found"}, status=404)
+    return FileResponse(open(path, "rb"), content_type="image/png")
     
 
 # user views
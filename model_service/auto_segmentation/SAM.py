@@ -1,9 +1,28 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
 import torch
 import numpy as np
-from segment_anything import sam_model_registry, SamAutomaticMaskGenerator
+from segment_anything import sam_model_registry, SamAutomaticMaskGenerator, SamPredictor
 from fastapi import HTTPException
 import logging
 import PIL
+from PIL import Image
+
+# Image embeddings kept for prompted segmentation, about 4 MB of VRAM each
+SAM_EMBEDDING_CACHE_SIZE = int(os.getenv("SAM_EMBEDDING_CACHE_SIZE", "8"))
+
+# Automatic mask generation tiers: SamAutomaticMaskGenerator settings plus the
+# longest input side (None keeps the full resolution). models.yaml may override
+# any of them under `tiers:` and pick `default_tier:`.
+SAM_TIERS = {
+    "fast": {"points_per_side": 16, "points_per_batch": 256, "crop_n_layers": 0, "max_side": 1024},
+    "balanced": {"points_per_side": 24, "points_per_batch": 128, "crop_n_layers": 0, "max_side": 1536},
+    # SamAutomaticMaskGenerator defaults, what every request used before tiers existed
+    "full": {"points_per_side": 32, "points_per_batch": 64, "crop_n_layers": 0, "max_side": None},
+}
+DEFAULT_SAM_TIER = "balanced"
 
 
 logger = logging.getLogger(__name__)
@@ -14,11 +33,20 @@ class SAMSegmenter:
     Autosegmentation using Meta's Segment Anything Model (SAM).
     """
 
-    def __init__(self, model_type: str = "vit_h", device: str = None):
+    def __init__(self, model_type: str = "vit_h", device: str = None, tiers: dict = None, default_tier: str = None):
         self.model_type = model_type
         self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        self.tiers = {name: dict(settings) for name, settings in SAM_TIERS.items()}
+        for name, settings in (tiers or {}).items():
+            self.tiers.setdefault(name, {}).update(settings)
+        self.default_tier = default_tier or DEFAULT_SAM_TIER
         self.sam = None
-        self.mask_generator = None
+        # one generator per tier, built on first use
+        self.mask_generators = {}
+        self.predictor = None
+        # image hash -> predictor state after set_image, least recently used first
+        self._embeddings = OrderedDict()
+        self._embeddings_lock = threading.Lock()
 
     # ------------- Loading / Unloading -------------
 
@@ -28,7 +56,7 @@ class SAMSegmenter:
             logger.info(f"Loading SAM {self.model_type} z {checkpoint_path} na {self.device}")
             self.sam = sam_model_registry[self.model_type](checkpoint=checkpoint_path)
             self.sam.to(device=self.device)
-            self.mask_generator = SamAutomaticMaskGenerator(self.sam)
+            self.predictor = SamPredictor(self.sam)
         except Exception as e:
             logger.exception("Loading while loading SAM")
             raise HTTPException(status_code=500, detail=f"Error loading SAM: {e}")
@@ -39,30 +67,160 @@ class SAMSegmenter:
             if self.sam is not None:
                 del self.sam
                 self.sam = None
-            self.mask_generator = None
+            self.mask_generators = {}
+            self.predictor = None
+            self._embeddings.clear()
             if self.device == "cuda":
                 torch.cuda.empty_cache()
         except Exception as e:
             logger.warning(f"Error while unloading SAM: {e}")
 
+    def release_device_caches(self):
+        """
+        Drops the cached image embeddings, called by the registry before the
+        model moves to the host tier so their VRAM is freed with the weights.
+        """
+        with self._embeddings_lock:
+            self._embeddings.clear()
+        if self.predictor is not None:
+            self.predictor.reset_image()
+
     # ------------- Segmentation -------------
 
-    def auto_segment(self, image: PIL.Image.Image):
+    def _generator(self, tier: str) -> SamAutomaticMaskGenerator:
+        if tier not in self.mask_generators:
+            settings = {k: v for k, v in self.tiers[tier].items() if k != "max_side"}
+            self.mask_generators[tier] = SamAutomaticMaskGenerator(self.sam, **settings)
+        return self.mask_generators[tier]
+
+    @staticmethod
+    def _upsample_masks(masks: list, scale: float, size) -> list:
+        """Maps masks generated on a downscaled image back to the original size."""
+        width, height = size
+        for mask in masks:
+            segmentation = Image.fromarray(mask["segmentation"]).resize((width, height), Image.NEAREST)
+            mask["segmentation"] = np.array(segmentation, dtype=bool)
+            mask["area"] = int(mask["segmentation"].sum())
+            mask["bbox"] = [value / scale for value in mask["bbox"]]
+            mask["point_coords"] = [[x / scale, y / scale] for x, y in mask.get("point_coords", [])]
+            if "crop_box" in mask:
+                mask["crop_box"] = [value / scale for value in mask["crop_box"]]
+        return masks
+
+    def auto_segment(self, image: PIL.Image.Image, tier: str = None):
         """
         image: PIL.Image.Image (RGB)
-        return: list[dict] — masks SAM
+        tier: fast / balanced / full (or a tier from models.yaml), model default if None
+        return: list[dict] — masks SAM, always at the input resolution
         """
-        if self.mask_generator is None:
+        if self.sam is None:
             raise HTTPException(status_code=500, detail="SAM not loaded")
 
+        tier = tier or self.default_tier
+        if tier not in self.tiers:
+            raise HTTPException(status_code=400, detail=f"Unknown SAM tier: {tier}")
+
         try:
             # konwersja PIL -> numpy (RGB)
             if image.mode != "RGB":
                 image = image.convert("RGB")
+
+            original_size = image.size
+            max_side = self.tiers[tier].get("max_side")
+            scale = 1.0
+            if max_side and max(original_size) > max_side:
+                scale = max_side / max(original_size)
+                image = image.resize(
+                    (round(image.width * scale), round(image.height * scale)), Image.LANCZOS
+                )
             np_image = np.array(image)
 
-            masks = self.mask_generator.generate(np_image)
+            masks = self._generator(tier).generate(np_image)
+            if scale != 1.0:
+                masks = self._upsample_masks(masks, scale, original_size)
             return masks
         except Exception as e:
             logger.exception("Error while segmenting")
-            raise HTTPException(status_code=500, detail=f"Segmentation error: {e}")
\ No newline at end of file
+            raise HTTPException(status_code=500, detail=f"Segmentation error: {e}")
+
+    # ------------- Prompted segmentation -------------
+
+    @staticmethod
+    def image_hash(image: PIL.Image.Image) -> str:
+        """Content hash used as the embedding cache key and returned to clients as image_id."""
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        digest = hashlib.sha256(f"{image.size}".encode())
+        digest.update(image.tobytes())
+        return digest.hexdigest()
+
+    def has_embedding(self, image_id: str) -> bool:
+        return image_id in self._embeddings
+
+    def _set_image(self, image_id: str, image: PIL.Image.Image = None):
+        """Points the predictor at image_id, running the image encoder only on a cache miss."""
+        with self._embeddings_lock:
+            state = self._embeddings.get(image_id)
+            if state is not None:
+                self._embeddings.move_to_end(image_id)
+
+        if state is None:
+            if image is None:
+                raise HTTPException(status_code=404, detail="Unknown image_id, send the image again")
+            if image.mode != "RGB":
+                image = image.convert("RGB")
+            self.predictor.set_image(np.array(image))
+            state = {
+                "features": self.predictor.features,
+                "original_size": self.predictor.original_size,
+                "input_size": self.predictor.input_size,
+            }
+            with self._embeddings_lock:
+                self._embeddings[image_id] = state
+                while len(self._embeddings) > SAM_EMBEDDING_CACHE_SIZE:
+                    self._embeddings.popitem(last=False)
+            return
+
+        self.predictor.features = state["features"]
+        self.predictor.original_size = state["original_size"]
+        self.predictor.input_size = state["input_size"]
+        self.predictor.is_image_set = True
+
+    def segment_prompt(
+        self,
+        image_id: str,
+        image: PIL.Image.Image = None,
+        points=None,
+        labels=None,
+        box=None,
+        multimask_output: bool = True,
+    ):
+        """
+        Masks for point clicks (labels: 1 foreground, 0 background) and/or a
+        box [x0, y0, x1, y1]. After the first call for an image only the mask
+        decoder runs. Returns a list of {segmentation, score}, best first.
+        """
+        if self.predictor is None:
+            raise HTTPException(status_code=500, detail="SAM not loaded")
+        if not points and box is None:
+            raise HTTPException(status_code=400, detail="At least one point or a box is required")
+
+        try:
+            self._set_image(image_id, image)
+            point_coords = np.array(points, dtype=np.float32) if points else None
+            point_labels = None
+            if points:
+                point_labels = np.array(labels if labels else [1] * len(points), dtype=np.int64)
+            masks, scores, _ = self.predictor.predict(
+                point_coords=point_coords,
+                point_labels=point_labels,
+                box=np.array(box, dtype=np.float32) if box is not None else None,
+                multimask_output=multimask_output,
+            )
+            order = np.argsort(-scores)
+            return [{"segmentation": masks[i], "score": float(scores[i])} for i in order]
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.exception("Error while segmenting with prompts")
+            raise HTTPException(status_code=500, detail=f"Segmentation error: {e}")
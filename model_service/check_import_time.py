@@ -0,0 +1,98 @@
+"""
+Import-time budget check for the model service.
+
+Imports main in a fresh interpreter with -X importtime and fails when the
+startup import takes longer than the budget, or when a heavy inference
+stack that should only load with its first model is imported eagerly.
+It also imports every CLASS_MAP wrapper, since lazy loading would otherwise
+only surface a broken path when the first request for that model arrives.
+
+Usage:
+    python check_import_time.py [--budget SECONDS] [--skip-class-map]
+"""
+import os
+import sys
+import argparse
+import subprocess
+
+# Packages that must be imported lazily through CLASS_MAP, never by `import main`
+LAZY_PACKAGES = ("diffusers", "segment_anything", "realesrgan", "basicsr", "transformers")
+IMPORT_BUDGET_SECONDS = float(os.getenv("IMPORT_BUDGET_SECONDS", "5"))
+
+
+def measure() -> dict:
+    """Returns cumulative import time in microseconds per top-level package."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import main failed:\n{result.stderr[-2000:]}")
+
+    packages = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = [part.strip() for part in line[len("import time:"):].split("|")]
+        if not cumulative.isdigit():
+            continue
+        top = name.strip().split(".")[0]
+        # the outermost entry of a package carries its full cumulative time
+        packages[top] = max(packages.get(top, 0), int(cumulative))
+    return packages
+
+
+def check_class_map() -> list:
+    """Imports every CLASS_MAP wrapper in a fresh interpreter, returns the ones that fail."""
+    code = (
+        "from services.registry import CLASS_MAP, load_class\n"
+        "for name in CLASS_MAP:\n"
+        "    try:\n"
+        "        load_class(name)\n"
+        "    except Exception as e:\n"
+        "        print(f'{name} ({CLASS_MAP[name]}): {type(e).__name__}: {e}')\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"CLASS_MAP check failed:\n{result.stderr[-2000:]}")
+    return result.stdout.splitlines()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Check model service import time against a budget.")
+    parser.add_argument("--budget", type=float, default=IMPORT_BUDGET_SECONDS, help="seconds allowed for `import main`")
+    parser.add_argument("--skip-class-map", action="store_true", help="do not import the CLASS_MAP wrappers")
+    args = parser.parse_args()
+
+    packages = measure()
+    total = packages.get("main", 0) / 1e6
+    for name, micros in sorted(packages.items(), key=lambda item: -item[1])[:10]:
+        print(f"{micros / 1e6:8.3f}s  {name}")
+    print(f"import main: {total:.3f}s (budget {args.budget:.3f}s)")
+
+    failed = False
+    eager = [name for name in LAZY_PACKAGES if name in packages]
+    if eager:
+        print(f"[FAIL] imported at startup, should be lazy: {', '.join(eager)}")
+        failed = True
+    if total > args.budget:
+        print("[FAIL] import time over budget")
+        failed = True
+
+    if not args.skip_class_map:
+        broken = check_class_map()
+        for line in broken:
+            print(f"[FAIL] CLASS_MAP entry does not import: {line}")
+        failed = failed or bool(broken)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
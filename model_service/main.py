@@ -1,19 +1,33 @@
 from fastapi import FastAPI
-from routes import editing_routes, auto_segmentation, upscaler_routes, generate_routes
+from fastapi.responses import JSONResponse
+from routes import editing_routes, auto_segmentation, upscaler_routes, generate_routes, cache_routes, job_routes
 from services.registry import ModelManager
+from services.warmup import start_preload, readiness
 
 app = FastAPI()
 
 @app.on_event("startup")
 async def startup_event():
     ModelManager.load_config()
+    # idle segmentation/upscaler models leave the GPU after AUX_MODEL_IDLE_TTL
+    ModelManager.start_idle_reaper()
+    # runs on the inference executor, the service answers /health meanwhile
+    start_preload()
 
 @app.get("/health")
 async def health_check():
     return {"status": "ok"}
 
+@app.get("/ready")
+async def readiness_check():
+    """Reports which preload models are warm, 503 until all of them finished warming up."""
+    state = readiness()
+    return JSONResponse(state, status_code=200 if state["ready"] else 503)
+
 
 app.include_router(editing_routes.router)
 app.include_router(auto_segmentation.router)
 app.include_router(upscaler_routes.router)
-app.include_router(generate_routes.router)
\ No newline at end of file
+app.include_router(generate_routes.router)
+app.include_router(cache_routes.router)
+app.include_router(job_routes.router)
\ No newline at end of file
@@ -0,0 +1,62 @@
+"""
+Offline model preparation.
+
+Converts every single-file checkpoint in models.yaml once into the
+converted-checkpoint cache (one safetensors file per component, already in
+the dtype the wrapper loads with), so model loads and restarts skip the
+single-file parsing and conversion.
+
+Usage:
+    python prepare_models.py [--config models.yaml] [--model NAME] [--force]
+"""
+import argparse
+import logging
+import torch
+
+from services.registry import ModelManager, load_class
+from stable_diffusion.checkpoint_cache import convert_checkpoint, is_single_file
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+logger = logging.getLogger("prepare_models")
+
+
+def prepare(config_path: str = None, only: list = None, force: bool = False) -> int:
+    ModelManager.load_config(config_path)
+    failures = 0
+
+    for name, info in ModelManager._model_map.items():
+        if only and name not in only:
+            continue
+        model_path = info["path"]
+        if not is_single_file(model_path):
+            logger.info(f"Skipping {name}: {model_path} is not a single-file checkpoint")
+            continue
+
+        for class_key in ("class", "class_t2i"):
+            class_name = info.get(class_key)
+            if not class_name:
+                continue
+            try:
+                pipeline_cls = getattr(load_class(class_name), "PIPELINE_CLASS", None)
+            except (ValueError, ImportError) as e:
+                logger.warning(f"Skipping {name} ({class_name}): {e}")
+                continue
+            if pipeline_cls is None:
+                logger.info(f"Skipping {name} ({class_name}): no single-file pipeline")
+                continue
+            try:
+                convert_checkpoint(pipeline_cls, model_path, torch_dtype=torch.float16, force=force)
+            except Exception:
+                logger.exception(f"Failed to convert {name} ({class_name})")
+                failures += 1
+
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert models.yaml checkpoints into the load cache.")
+    parser.add_argument("--config", default=None, help="models.yaml path (defaults to MODELS_YAML_PATH)")
+    parser.add_argument("--model", action="append", help="only prepare this model, may be repeated")
+    parser.add_argument("--force", action="store_true", help="convert again even if a valid cache exists")
+    args = parser.parse_args()
+    raise SystemExit(1 if prepare(args.config, args.model, args.force) else 0)
@@ -1,15 +1,71 @@
-from fastapi import APIRouter, UploadFile, File, Form
+import json
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException
 from fastapi.responses import JSONResponse
-from services.auto_segmentation_services import auto_segment
-from PIL import Image
+from services.auto_segmentation_services import auto_segment, prompted_segment
+from services.mask_codec import RLE_FORMAT
+from services.inference_executor import run_inference, run_interactive
+from services.media_inputs import load_input_image
 
 router = APIRouter()
 @router.post("/auto_segmentation")
 async def get_models(
     model: str = Form(...),
-    image: UploadFile = File(...)
+    image: UploadFile = File(None),
+    image_path: str = Form(None),
+    mask_format: str = Form(RLE_FORMAT),
+    tier: str = Form(None),
 ):
     """
-    Returns a list of masks.
+    Returns a list of masks. Segmentations are COCO-style uncompressed RLE
+    unless mask_format is "list" (legacy nested lists of ints).
+    tier (fast / balanced / full) trades mask density for speed, the model's
+    default_tier from models.yaml is used when omitted.
     """
-    return JSONResponse({"status": "success", "masks": auto_segment(model, Image.open(image.file).convert("RGB"))})
+    pil_image = await load_input_image(image, image_path)
+    masks = await run_inference(auto_segment, model, pil_image, mask_format, tier)
+    return JSONResponse({"status": "success", "format": mask_format, "masks": masks})
+
+
+def _parse_json_field(value: str, name: str):
+    if not value:
+        return None
+    try:
+        return json.loads(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{name} must be JSON")
+
+
+@router.post("/segment")
+async def segment_with_prompts(
+    model: str = Form(...),
+    image: UploadFile = File(None),
+    image_path: str = Form(None),
+    image_id: str = Form(None),
+    points: str = Form(None),
+    labels: str = Form(None),
+    box: str = Form(None),
+    multimask_output: bool = Form(True),
+    mask_format: str = Form(RLE_FORMAT),
+):
+    """
+    Segments from point clicks ([[x, y], ...] with labels [1, 0, ...]) and/or
+    a box [x0, y0, x1, y1]. The first call uploads the image, the returned
+    image_id can replace it on later clicks while its embedding is cached.
+    """
+    if image is None and not image_path and not image_id:
+        raise HTTPException(status_code=400, detail="Either image, image_path or image_id is required")
+
+    pil_image = await load_input_image(image, image_path, required=False)
+    image_id, masks = await run_interactive(
+        prompted_segment,
+        model,
+        image=pil_image,
+        image_id=image_id,
+        points=_parse_json_field(points, "points"),
+        labels=_parse_json_field(labels, "labels"),
+        box=_parse_json_field(box, "box"),
+        multimask_output=multimask_output,
+        mask_format=mask_format,
+    )
+    return JSONResponse({"status": "success", "image_id": image_id, "format": mask_format, "masks": masks})
+
@@ -0,0 +1,22 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+from services.registry import ModelManager
+from services.inference_executor import queue_state
+from services.output_writer import writer_stats
+
+router = APIRouter()
+
+@router.get("/cache")
+async def get_cache_state():
+    """
+    Returns resident models, their measured sizes, cache hit/eviction counters
+    the inference queue and output writer stage timings.
+    """
+    return JSONResponse({
+        "status": "success",
+        # the registry lock may be held during an eviction, keep it off the event loop
+        "cache": await run_in_threadpool(ModelManager.cache_stats),
+        "queue": queue_state(),
+        "writer": writer_stats(),
+    })
@@ -1,16 +1,24 @@
 from fastapi import APIRouter, UploadFile, File, Form
 from fastapi.responses import JSONResponse
-import io
-from services.editing_services import process_image_file
-from PIL import Image
+from services.editing_services import (
+    process_image_file,
+    INPAINT_ONLY_MASKED,
+    INPAINT_MASK_PADDING,
+    INPAINT_LATENT_PASSES,
+    INPAINT_PASS_PREVIEWS,
+)
+from services.media_inputs import load_input_image
 from services.registry import ModelManager
+from services.inference_executor import run_inference
 
 router = APIRouter()
 
 @router.post("/process-image")
 async def process_image(
-    image: UploadFile,
+    image: UploadFile = File(None),
     mask: UploadFile = File(None),
+    image_path: str = Form(None),
+    mask_path: str = Form(None),
     prompt: str = Form(...),
     negative_prompt: str = Form(None),
     job_id: int = Form(...),
@@ -21,13 +29,16 @@ async def process_image(
     passes: int = Form(4),
     seed: int = Form(None),
     finish_model: str = Form(None),
+    only_masked: bool = Form(INPAINT_ONLY_MASKED),
+    mask_padding: int = Form(INPAINT_MASK_PADDING),
+    latent_passes: bool = Form(INPAINT_LATENT_PASSES),
+    pass_previews: bool = Form(INPAINT_PASS_PREVIEWS),
 ):
-    input_img = Image.open(io.BytesIO(await image.read())).convert("RGB")
-    mask_img = None
-    if mask:
-        mask_img = Image.open(io.BytesIO(await mask.read())).convert("RGB")
+    input_img = await load_input_image(image, image_path)
+    mask_img = await load_input_image(mask, mask_path, name="mask", required=False)
 
-    output_path = process_image_file(
+    output_path = await run_inference(
+        process_image_file,
         input_img=input_img,
         mask_img=mask_img,
         prompt=prompt,
@@ -40,6 +51,10 @@ async def process_image(
         seed=seed,
         passes=passes,
         finish_model=finish_model,
+        only_masked=only_masked,
+        mask_padding=mask_padding,
+        latent_passes=latent_passes,
+        pass_previews=pass_previews,
     )
 
     return JSONResponse({"output_url": output_path})
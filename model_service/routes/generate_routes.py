@@ -1,7 +1,7 @@
 from fastapi import APIRouter, UploadFile, File, Form
 from fastapi.responses import JSONResponse
 import io
-from services.generate_services import generate_image_file
+from services.batching import t2i_batcher
 from PIL import Image
 from services.registry import ModelManager
 
@@ -16,9 +16,12 @@ async def process_image(
     guidance_scale: float = Form(9.5),
     steps: int = Form(40),
     seed: int = Form(None),
+    width: int = Form(None),
+    height: int = Form(None),
 ):
 
-    output_path = generate_image_file(
+    # Requests with matching settings that arrive together share one pipeline call
+    output_path = await t2i_batcher.submit(
         prompt=prompt,
         negative_prompt = negative_prompt,
         job_id=job_id,
@@ -26,6 +29,8 @@ async def process_image(
         guidance_scale=guidance_scale,
         steps=steps,
         seed=seed,
+        width=width,
+        height=height,
     )
 
     return JSONResponse({"output_url": output_path})
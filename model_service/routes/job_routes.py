@@ -0,0 +1,18 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from services.cancellation import cancel, cancelled_jobs
+
+router = APIRouter()
+
+@router.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: int):
+    """
+    Flags a job as cancelled. A running diffusion call stops after its current
+    step, a queued one is skipped as soon as it reaches a worker.
+    """
+    cancel(job_id)
+    return JSONResponse({"status": "cancelled", "job_id": job_id})
+
+@router.get("/jobs/cancelled")
+async def get_cancelled_jobs():
+    return JSONResponse({"status": "success", "jobs": cancelled_jobs()})
@@ -1,26 +1,63 @@
-from services.registry import ModelManager
+from services.registry import ModelManager, SEGMENTATION
+from services.mask_codec import encode_rle, RLE_FORMAT
 import PIL
 import numpy as np
 
+def _encode_segmentation(segmentation, mask_format: str):
+    if mask_format == RLE_FORMAT:
+        return encode_rle(segmentation)
+    # legacy nested lists, hundreds of MB for large images with many masks
+    return segmentation.astype(int).tolist()
+
 def auto_segment(
         model_name: str,
         image: PIL.Image.Image,
+        mask_format: str = RLE_FORMAT,
+        tier: str = None,
 ):
-    model = ModelManager.get_auto_segmentation_model(model_name)
-
-    masks = model.auto_segment(image)
+    with ModelManager.use(SEGMENTATION, model_name) as model:
+        masks = model.auto_segment(image, tier=tier)
 
-    ModelManager.unload_model(model_name)
     masks_list = []
     for mask in masks:
         if isinstance(mask, dict):
             mask_copy = mask.copy()
             if isinstance(mask_copy.get('segmentation'), np.ndarray):
-                mask_copy['segmentation'] = mask_copy['segmentation'].astype(int).tolist()
+                mask_copy['segmentation'] = _encode_segmentation(mask_copy['segmentation'], mask_format)
             masks_list.append(mask_copy)
         elif isinstance(mask, np.ndarray):
-            masks_list.append(mask.astype(int).tolist())
+            masks_list.append(_encode_segmentation(mask, mask_format))
         else:
             raise TypeError(f"Unexpected mask type: {type(mask)}")
 
-    return masks_list 
+    return masks_list
+
+def prompted_segment(
+        model_name: str,
+        image: PIL.Image.Image = None,
+        image_id: str = None,
+        points=None,
+        labels=None,
+        box=None,
+        multimask_output: bool = True,
+        mask_format: str = RLE_FORMAT,
+):
+    """
+    Point/box prompted segmentation. The image embedding is cached by content
+    hash, later clicks on the same image may send only the returned image_id.
+    """
+    with ModelManager.use(SEGMENTATION, model_name) as model:
+        if image is not None:
+            image_id = model.image_hash(image)
+        masks = model.segment_prompt(
+            image_id,
+            image=image,
+            points=points,
+            labels=labels,
+            box=box,
+            multimask_output=multimask_output,
+        )
+
+    for mask in masks:
+        mask['segmentation'] = _encode_segmentation(mask['segmentation'], mask_format)
+    return image_id, masks
@@ -0,0 +1,105 @@
+import os
+import asyncio
+import logging
+from typing import Dict, List, Tuple
+from dotenv import load_dotenv
+from services.generate_services import generate_image_files
+from services.inference_executor import submit
+from services.cancellation import raise_if_cancelled
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# How long a text-to-image request waits for companions and how many can share one call
+T2I_BATCH_WINDOW_MS = float(os.getenv("T2I_BATCH_WINDOW_MS", "50"))
+T2I_MAX_BATCH_SIZE = int(os.getenv("T2I_MAX_BATCH_SIZE", "4"))
+
+
+class TextToImageBatcher:
+    """
+    Collects text-to-image requests for a short window and runs the ones with
+    the same model, resolution, steps and guidance as one batched pipeline call.
+    Each caller gets back its own output path.
+    """
+
+    def __init__(self, window_ms: float = T2I_BATCH_WINDOW_MS, max_batch_size: int = T2I_MAX_BATCH_SIZE):
+        self.window = window_ms / 1000.0
+        self.max_batch_size = max(1, max_batch_size)
+        self._pending: Dict[Tuple, List[dict]] = {}
+
+    async def submit(
+        self,
+        *,
+        prompt: str,
+        negative_prompt: str,
+        job_id: int,
+        model: str,
+        guidance_scale: float,
+        steps: int,
+        seed: int = None,
+        width: int = None,
+        height: int = None,
+    ) -> str:
+        loop = asyncio.get_running_loop()
+        key = (model, width, height, steps, guidance_scale)
+        item = {
+            "prompt": prompt,
+            "negative_prompt": negative_prompt,
+            "job_id": job_id,
+            "seed": seed,
+            "future": loop.create_future(),
+        }
+
+        group = self._pending.setdefault(key, [])
+        group.append(item)
+        if len(group) >= self.max_batch_size:
+            self._flush(key, group)
+        elif len(group) == 1:
+            loop.call_later(self.window, self._flush, key, group)
+
+        output_path = await item["future"]
+        if output_path is None:
+            raise_if_cancelled(job_id)
+        return output_path
+
+    def _flush(self, key: Tuple, group: List[dict]):
+        # The timer of a group that was already flushed because it filled up is a no-op
+        if self._pending.get(key) is not group:
+            return
+        del self._pending[key]
+
+        model, width, height, steps, guidance_scale = key
+        logger.info(f"Running text-to-image batch of {len(group)} on {model}")
+        try:
+            future = submit(
+                generate_image_files,
+                model=model,
+                items=[{k: v for k, v in item.items() if k != "future"} for item in group],
+                guidance_scale=guidance_scale,
+                steps=steps,
+                width=width,
+                height=height,
+            )
+        except Exception as e:
+            self._resolve(group, error=e)
+            return
+
+        def _done(batch_future):
+            error = batch_future.exception()
+            self._resolve(group, results=None if error else batch_future.result(), error=error)
+
+        asyncio.wrap_future(future).add_done_callback(_done)
+
+    @staticmethod
+    def _resolve(group: List[dict], results: List[str] = None, error: Exception = None):
+        for index, item in enumerate(group):
+            if item["future"].done():
+                continue
+            if error is not None:
+                item["future"].set_exception(error)
+            else:
+                item["future"].set_result(results[index])
+
+
+t2i_batcher = TextToImageBatcher()
@@ -0,0 +1,39 @@
+import os
+import time
+import threading
+from fastapi import HTTPException
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# How long a cancel request is remembered, it must outlive the wait in the inference queue
+CANCEL_TTL_SECONDS = float(os.getenv("CANCEL_TTL_SECONDS", "3600"))
+
+_cancelled = {}
+_lock = threading.Lock()
+
+
+def cancel(job_id: int):
+    """Flags a job as cancelled, running and queued work stops at its next check."""
+    now = time.time()
+    with _lock:
+        for expired in [key for key, at in _cancelled.items() if now - at > CANCEL_TTL_SECONDS]:
+            del _cancelled[expired]
+        _cancelled[int(job_id)] = now
+
+
+def is_cancelled(job_id) -> bool:
+    if job_id is None:
+        return False
+    return int(job_id) in _cancelled
+
+
+def raise_if_cancelled(job_id):
+    """Aborts the current request with 409 so the executor slot is released."""
+    if is_cancelled(job_id):
+        raise HTTPException(status_code=409, detail=f"Job {job_id} was cancelled")
+
+
+def cancelled_jobs():
+    with _lock:
+        return sorted(_cancelled)
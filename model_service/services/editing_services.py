@@ -3,8 +3,11 @@ import os
 import logging
 from dotenv import load_dotenv
 from urllib.parse import urljoin
-from services.registry import ModelManager
+from services.registry import ModelManager, INPAINT
 from services.preprocessing import preprocess_canny
+from services import output_writer
+from services.cancellation import raise_if_cancelled
+from functools import partial
 
 logging.basicConfig(level=logging.DEBUG, format="%(asctime)s [%(levelname)s] %(message)s")
 logger = logging.getLogger("my_app")
@@ -44,11 +47,17 @@ def notify_progress(job_id: int, progress: int, output_path: str):
 
 import os
 import numpy as np
-from scipy import ndimage
-from PIL import Image, ImageFilter
+from PIL import Image, ImageFilter, ImageOps
+
+INPAINT_ONLY_MASKED = os.getenv("INPAINT_ONLY_MASKED", "false").lower() in ("1", "true", "yes")
+INPAINT_MASK_PADDING = int(os.getenv("INPAINT_MASK_PADDING", "32"))
+INPAINT_LATENT_PASSES = os.getenv("INPAINT_LATENT_PASSES", "false").lower() in ("1", "true", "yes")
+INPAINT_PASS_PREVIEWS = os.getenv("INPAINT_PASS_PREVIEWS", "true").lower() in ("1", "true", "yes")
 
 def dilate_mask(mask: Image.Image, kernel_size: int = 3, iterations: int = 1) -> Image.Image:
     """Expands the mask so the model can better process edges."""
+    from scipy import ndimage
+
     mask_np = np.array(mask.convert("L")) / 255.0
     struct = np.ones((kernel_size, kernel_size))
     mask_np = ndimage.binary_dilation(mask_np, structure=struct, iterations=iterations)
@@ -60,6 +69,42 @@ def feather_mask(mask: Image.Image, radius: int = 5) -> Image.Image:
     return mask.filter(ImageFilter.GaussianBlur(radius=radius))
 
 
+def masked_region(mask: Image.Image, padding: int = INPAINT_MASK_PADDING):
+    """
+    Bounding box of the area to repaint plus padding pixels of context,
+    clipped to the image. The wrappers invert the mask, so the repainted area
+    is the dark part of it. Returns None when nothing is masked.
+    """
+    bbox = ImageOps.invert(mask.convert("L")).point(lambda v: 255 if v >= 128 else 0).getbbox()
+    if bbox is None:
+        return None
+    left, top, right, bottom = bbox
+    return (
+        max(0, left - padding),
+        max(0, top - padding),
+        min(mask.width, right + padding),
+        min(mask.height, bottom + padding),
+    )
+
+
+def crop_to_native(img: Image.Image, box, native: int, resample=Image.LANCZOS) -> Image.Image:
+    """Crops box out of img and resizes it so its longer side matches the model resolution."""
+    crop = img.crop(box)
+    scale = native / max(crop.size)
+    size = (max(8, round(crop.width * scale / 8) * 8), max(8, round(crop.height * scale / 8) * 8))
+    return crop.resize(size, resample)
+
+
+def paste_region(base: Image.Image, generated: Image.Image, mask: Image.Image, box) -> Image.Image:
+    """Pastes a generated crop back into base, blended with the feathered mask."""
+    size = (box[2] - box[0], box[3] - box[1])
+    generated = generated.convert(base.mode).resize(size, Image.LANCZOS)
+    alpha = ImageOps.invert(mask.convert("L").crop(box))
+    result = base.copy()
+    result.paste(Image.composite(generated, base.crop(box), alpha), box[:2])
+    return result
+
+
 def process_image_file(
     input_img: Image.Image,
     mask_img: Image.Image,
@@ -73,17 +118,43 @@ def process_image_file(
     seed: int = None,
     passes: int = 4,
     finish_model: str = None,
+    only_masked: bool = INPAINT_ONLY_MASKED,
+    mask_padding: int = INPAINT_MASK_PADDING,
+    latent_passes: bool = INPAINT_LATENT_PASSES,
+    pass_previews: bool = INPAINT_PASS_PREVIEWS,
 ) -> str:
     os.makedirs(MEDIA_ROOT, exist_ok=True)
 
     if not finish_model:
         finish_model = model
 
-    output_path = os.path.join(MEDIA_ROOT, f"output_{job_id}_iter{0}.png")
-    input_img.save(output_path)
-    notify_progress(job_id, 0, convert_system_path_to_url(output_path))
+    try:
+        return _run_passes(
+            input_img, mask_img, prompt, negative_prompt, job_id, model, strength,
+            guidance_scale, steps, seed, passes, finish_model, only_masked,
+            mask_padding, latent_passes, pass_previews,
+        )
+    finally:
+        # intermediate images and notifications are written while the next pass runs
+        output_writer.flush(job_id)
+
+
+def _queue_output(job_id: int, image: Image.Image, output_path: str, progress):
+    """Saves an intermediate image and reports it on the output writer thread."""
+    output_writer.submit(
+        job_id,
+        ("save", partial(image.save, output_path)),
+        ("notify", partial(notify_progress, job_id, progress, convert_system_path_to_url(output_path))),
+    )
+
 
-    model_instance = ModelManager.get_model(model)
+def _run_passes(
+    input_img, mask_img, prompt, negative_prompt, job_id, model, strength,
+    guidance_scale, steps, seed, passes, finish_model, only_masked,
+    mask_padding, latent_passes, pass_previews,
+) -> str:
+    output_path = os.path.join(MEDIA_ROOT, f"output_{job_id}_iter{0}.png")
+    _queue_output(job_id, input_img, output_path, 0)
 
     PREPROCESSORS = {
         "sd1.5-controlnet-canny": preprocess_canny,
@@ -107,9 +178,37 @@ def process_image_file(
     if model in PREPROCESSORS:
         extra_kwargs["control_img"] = PREPROCESSORS[model](input_img)
 
+    pass_prompts = [
+        prompt_sequence[i] if i < len(prompt_sequence) else prompt
+        for i in range(passes)
+    ]
+    pass_models = [
+        finish_model if i == passes - 1 else model
+        for i in range(passes)
+    ]
+    encoded_models = set()
+
+    # "only masked area": denoise a padded crop around the mask instead of the whole frame
+    crop_box = None
+    if only_masked and mask_img is not None:
+        if mask_img.size != input_img.size:
+            mask_img = mask_img.resize(input_img.size, Image.NEAREST)
+        crop_box = masked_region(mask_img, mask_padding)
+    if crop_box is not None and crop_box == (0, 0, *input_img.size):
+        crop_box = None
+
     current_img = input_img
+    # working image kept as latents between passes of the same model, with the
+    # pixels used for the masked-image conditioning: the picture they were
+    # encoded from, refreshed whenever a pass is decoded. Undecoded passes keep
+    # the last decoded pixels, outside the mask (all the conditioning sees) they
+    # only differ along the feathered edge, and decoding every pass would undo
+    # what latent passes save.
+    latents = None
+    latent_source = None
 
     for i in range(passes):
+        raise_if_cancelled(job_id)
         if model not in PREPROCESSORS:
             extra_kwargs = {}
             if model in PREPROCESSORS:
@@ -125,14 +224,15 @@ def process_image_file(
         feather_radius = max(2, 6 - i)
         mask_to_use = feather_mask(mask_to_use, radius=feather_radius)
 
+        pass_model = model
         if last_pass and model != finish_model:
-            model_instance = ModelManager.switch_model(old_model=model, new_model=finish_model)
+            pass_model = finish_model
             if finish_model in PREPROCESSORS:
                 extra_kwargs["control_img"] = PREPROCESSORS[finish_model](current_img)
             elif model in PREPROCESSORS:
                 extra_kwargs.pop("control_img", None)
 
-        cur_prompt = prompt_sequence[i] if i < len(prompt_sequence) else prompt
+        cur_prompt = pass_prompts[i]
 
         cur_strength = strength * (0.9 - 0.4 * i / (passes - 1))
         cur_strength = max(0.25, cur_strength)
@@ -140,22 +240,87 @@ def process_image_file(
         cur_steps = steps + i * 5
         iter_seed = seed + i if seed is not None else None
 
-        current_img = model_instance.generate_image(
-            job_id=job_id,
-            init_image=current_img,
-            mask_image=mask_to_use,
-            prompt=cur_prompt,
-            negative_prompt=negative_prompt,
-            strength=cur_strength,
-            guidance_scale=guidance_scale,
-            steps=cur_steps,
-            seed=iter_seed,
-            **extra_kwargs
-        )
+        pass_img = current_img
+        pass_mask = mask_to_use
+        pass_kwargs = extra_kwargs
+
+        with ModelManager.use(INPAINT, pass_model) as model_instance:
+            if crop_box is not None:
+                native = getattr(model_instance, "NATIVE_RESOLUTION", 512)
+                pass_img = crop_to_native(current_img, crop_box, native)
+                pass_mask = crop_to_native(mask_to_use, crop_box, native, Image.NEAREST)
+                pass_kwargs = dict(extra_kwargs)
+                if "control_img" in pass_kwargs:
+                    pass_kwargs["control_img"] = crop_to_native(pass_kwargs["control_img"], crop_box, native)
+
+            if pass_model not in encoded_models and hasattr(model_instance, "encode_prompts"):
+                # one encoder call for every pass this model will run
+                model_prompts = [p for p, m in zip(pass_prompts, pass_models) if m == pass_model]
+                model_instance.encode_prompts(
+                    model_prompts, [negative_prompt] * len(model_prompts), guidance_scale
+                )
+                encoded_models.add(pass_model)
+
+            generated = None
+            from_latents = False
+            if latent_passes and hasattr(model_instance, "generate_latents") and not pass_kwargs:
+                if latents is None:
+                    latents = model_instance.encode_image(pass_img)
+                    latent_source = pass_img
+                latents = model_instance.generate_latents(
+                    job_id=job_id,
+                    init_latents=latents,
+                    init_image=latent_source,
+                    mask_image=pass_mask,
+                    prompt=cur_prompt,
+                    negative_prompt=negative_prompt,
+                    strength=cur_strength,
+                    guidance_scale=guidance_scale,
+                    steps=cur_steps,
+                    seed=iter_seed,
+                )
+                # decode on model handoff, for the final output and for requested previews only
+                handoff = last_pass or pass_models[i + 1] != pass_model
+                if handoff or pass_previews:
+                    generated = model_instance.decode_latents(latents)
+                from_latents = True
+                if handoff:
+                    latents = None
+            else:
+                generated = model_instance.generate_image(
+                    job_id=job_id,
+                    init_image=pass_img,
+                    mask_image=pass_mask,
+                    prompt=cur_prompt,
+                    negative_prompt=negative_prompt,
+                    strength=cur_strength,
+                    guidance_scale=guidance_scale,
+                    steps=cur_steps,
+                    seed=iter_seed,
+                    **pass_kwargs
+                )
+
+        # an interrupted pipeline returns a half-denoised image, never save it
+        raise_if_cancelled(job_id)
+
+        if generated is None:
+            output_writer.submit(job_id, ("notify", partial(notify_progress, job_id, (i+1)/(passes+1), None)))
+            continue
+
+        if crop_box is not None:
+            current_img = paste_region(current_img, generated, mask_to_use, crop_box)
+        elif from_latents:
+            # decoded latents went through the VAE, restore the pixel-exact background
+            current_img = paste_region(current_img, generated, mask_to_use, (0, 0, *current_img.size))
+        else:
+            current_img = generated
+
+        if latents is not None:
+            # the next pass of this model is conditioned on the pixels just decoded
+            latent_source = crop_to_native(current_img, crop_box, native) if crop_box is not None else current_img
 
         output_path = os.path.join(MEDIA_ROOT, f"output_{job_id}_iter{i+1}.png")
-        current_img.save(output_path)
-        notify_progress(job_id, (i+1)/(passes+1), convert_system_path_to_url(output_path))
+        _queue_output(job_id, current_img, output_path, (i+1)/(passes+1))
 
     return output_path
 
@@ -1,9 +1,11 @@
 import os
 import logging
+from typing import Any, Dict, List
 from dotenv import load_dotenv
 from urllib.parse import urljoin
-from services.registry import ModelManager
+from services.registry import ModelManager, T2I
 from services.preprocessing import preprocess_canny
+from services.cancellation import is_cancelled
 
 logging.basicConfig(level=logging.DEBUG, format="%(asctime)s [%(levelname)s] %(message)s")
 logger = logging.getLogger("my_app")
@@ -11,15 +13,19 @@ logger = logging.getLogger("my_app")
 
 load_dotenv()
 
-def generate_image_file(
-    prompt: str,
-    negative_prompt: str,
-    job_id: int,
+def generate_image_files(
     model: str,
+    items: List[Dict[str, Any]],
     guidance_scale: float,
     steps: int,
-    seed: int = None,
-) -> str:
+    width: int = None,
+    height: int = None,
+) -> List[str]:
+    """
+    Generates one image per item (prompt, negative_prompt, job_id, seed) in a
+    single batched pipeline call and returns the output paths in item order.
+    Cancelled items get None instead of a path.
+    """
 
     BASE_MEDIA_ROOT = os.getenv("MEDIA_ROOT", "/data/media")
     MEDIA_ROOT = os.path.join(BASE_MEDIA_ROOT, "outputs")
@@ -32,26 +38,44 @@ def generate_image_file(
 
     os.makedirs(MEDIA_ROOT, exist_ok=True)
 
-    model_instance = ModelManager.get_model(model, t2i=True)
+    # jobs cancelled while waiting for a worker do not take part in the batch
+    active = [item for item in items if not is_cancelled(item["job_id"])]
+    if not active:
+        return [None] * len(items)
+    requested, items = items, active
 
-    if not negative_prompt:
-        negative_prompt = (
+    negative_prompts = [
+        item.get("negative_prompt") or (
             "blurry, cartoon, painting, illustration, drawing, deformed, distorted, "
             "extra limbs, bad anatomy, unrealistic proportions, plastic, doll-like, "
             "airbrushed, overexposed, flat lighting, low contrast, watermark, text, "
             "low quality, noisy, grainy, out of focus"
         )
+        for item in items
+    ]
 
-    current_img = model_instance.generate_image(
-        job_id = job_id,
-        prompt=prompt,
-        negative_prompt=negative_prompt,
-        guidance_scale=guidance_scale,
-        steps=steps,
-        seed=seed,
-        )
+    size_kwargs = {}
+    if width:
+        size_kwargs["width"] = width
+    if height:
+        size_kwargs["height"] = height
 
-    output_path = os.path.join(MEDIA_ROOT, f"output_{job_id}_gen.png")
-    current_img.save(output_path)
-    return output_path
+    with ModelManager.use(T2I, model) as model_instance:
+        images = model_instance.generate_images(
+            job_ids=[item["job_id"] for item in items],
+            prompts=[item["prompt"] for item in items],
+            negative_prompts=negative_prompts,
+            seeds=[item.get("seed") for item in items],
+            guidance_scale=guidance_scale,
+            steps=steps,
+            **size_kwargs,
+            )
 
+    output_paths = {}
+    for item, current_img in zip(items, images):
+        if is_cancelled(item["job_id"]):
+            continue
+        output_path = os.path.join(MEDIA_ROOT, f"output_{item['job_id']}_gen.png")
+        current_img.save(output_path)
+        output_paths[item["job_id"]] = output_path
+    return [output_paths.get(item["job_id"]) for item in requested]
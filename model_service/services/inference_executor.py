@@ -0,0 +1,73 @@
+import os
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Number of inference jobs running at once and how many more may wait for a worker
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "1"))
+INFERENCE_QUEUE_SIZE = int(os.getenv("INFERENCE_QUEUE_SIZE", "16"))
+# Separate lane for short interactive calls (prompted segmentation) so they do not wait behind diffusion jobs
+INTERACTIVE_WORKERS = int(os.getenv("INTERACTIVE_WORKERS", "1"))
+
+_executor = ThreadPoolExecutor(max_workers=INFERENCE_WORKERS, thread_name_prefix="inference")
+_interactive_executor = ThreadPoolExecutor(max_workers=INTERACTIVE_WORKERS, thread_name_prefix="interactive")
+# Startup warm-ups run one at a time on their own lane, so they never take INFERENCE_QUEUE_SIZE slots
+_preload_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="preload")
+_slots = threading.BoundedSemaphore(INFERENCE_WORKERS + INFERENCE_QUEUE_SIZE)
+_pending = 0
+_pending_lock = threading.Lock()
+
+
+def _track(delta: int):
+    global _pending
+    with _pending_lock:
+        _pending += delta
+
+
+def submit(fn, *args, **kwargs):
+    """
+    Queues blocking model work on the inference executor.
+    Raises 503 when the bounded queue is full, returns a concurrent Future otherwise.
+    """
+    if not _slots.acquire(blocking=False):
+        raise HTTPException(status_code=503, detail="Inference queue is full, try again later")
+    _track(1)
+
+    def _run():
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _track(-1)
+            _slots.release()
+
+    return _executor.submit(_run)
+
+
+async def run_inference(fn, *args, **kwargs):
+    """Runs fn on the inference executor without blocking the event loop."""
+    future = submit(fn, *args, **kwargs)
+    return await asyncio.wrap_future(future)
+
+
+async def run_interactive(fn, *args, **kwargs):
+    """Runs a short model call on the interactive lane, bypassing the inference queue."""
+    future = _interactive_executor.submit(functools.partial(fn, *args, **kwargs))
+    return await asyncio.wrap_future(future)
+
+
+def submit_preload(fn, *args, **kwargs):
+    """Queues a warm-up on the preload lane, returns a concurrent Future."""
+    return _preload_executor.submit(functools.partial(fn, *args, **kwargs))
+
+
+def queue_state():
+    return {
+        "workers": INFERENCE_WORKERS,
+        "capacity": INFERENCE_WORKERS + INFERENCE_QUEUE_SIZE,
+        "pending": _pending,
+    }
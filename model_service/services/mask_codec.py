@@ -0,0 +1,30 @@
+import numpy as np
+
+# Masks travel as COCO-style uncompressed RLE: {"size": [h, w], "counts": [...]}.
+# Runs are counted over the column-major (Fortran) flattened mask and always
+# start with a run of zeros, which may be empty.
+RLE_FORMAT = "rle"
+
+
+def encode_rle(mask: np.ndarray) -> dict:
+    """Encodes a 2D boolean mask as uncompressed RLE, vectorized with numpy."""
+    mask = np.asarray(mask, dtype=bool)
+    height, width = mask.shape
+    flat = mask.ravel(order="F")
+    if flat.size == 0:
+        return {"size": [height, width], "counts": []}
+
+    changes = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    counts = np.diff(np.concatenate(([0], changes, [flat.size])))
+    if flat[0]:
+        counts = np.concatenate(([0], counts))
+    return {"size": [height, width], "counts": counts.tolist()}
+
+
+def decode_rle(rle: dict) -> np.ndarray:
+    """Inverse of encode_rle, returns a boolean (h, w) array."""
+    height, width = rle["size"]
+    counts = np.asarray(rle["counts"], dtype=np.int64)
+    values = np.zeros(len(counts), dtype=bool)
+    values[1::2] = True
+    return np.repeat(values, counts).reshape((height, width), order="F")
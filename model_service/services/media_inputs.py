@@ -0,0 +1,52 @@
+import os
+from fastapi import HTTPException, UploadFile
+from starlette.concurrency import run_in_threadpool
+from PIL import Image
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Shared with the backend (same volume), inputs may be passed as paths relative to it
+BASE_MEDIA_ROOT = os.getenv("MEDIA_ROOT", "/data/media")
+
+
+def resolve_media_path(relative_path: str) -> str:
+    """Maps a media-relative path to a file under BASE_MEDIA_ROOT, refusing anything that escapes it."""
+    media_root = os.path.realpath(BASE_MEDIA_ROOT)
+    if os.path.isabs(relative_path):
+        raise HTTPException(status_code=400, detail=f"Media path must be relative: {relative_path}")
+
+    full_path = os.path.realpath(os.path.join(media_root, relative_path))
+    if os.path.commonpath([media_root, full_path]) != media_root:
+        raise HTTPException(status_code=400, detail=f"Media path outside the media root: {relative_path}")
+    if not os.path.isfile(full_path):
+        # the backend falls back to uploading when it sees this
+        raise HTTPException(status_code=404, detail=f"Media path not found: {relative_path}")
+    return full_path
+
+
+def open_input_image(upload: UploadFile = None, path: str = None, name: str = "image", required: bool = True):
+    """
+    Loads an RGB request image from a media-relative path or, as fallback for
+    deployments without the shared volume, from a multipart upload. Uploads
+    are decoded from their spooled file, without another in-memory copy.
+    """
+    if path:
+        source = resolve_media_path(path)
+    elif upload is not None:
+        source = upload.file
+    elif required:
+        raise HTTPException(status_code=400, detail=f"Either {name} or {name}_path is required")
+    else:
+        return None
+
+    try:
+        with Image.open(source) as image:
+            return image.convert("RGB")
+    except (OSError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Cannot read {name}: {e}")
+
+
+async def load_input_image(upload: UploadFile = None, path: str = None, name: str = "image", required: bool = True):
+    """open_input_image on the threadpool, decoding a large image on the event loop stalls every other request."""
+    return await run_in_threadpool(open_input_image, upload, path, name, required)
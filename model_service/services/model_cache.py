@@ -0,0 +1,124 @@
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+
+
+class CacheEntry:
+    """Bookkeeping for a single resident model instance."""
+
+    def __init__(self, key: str, instance: Any, size_bytes: int, pinned: bool = False, idle_ttl: Optional[float] = None):
+        self.key = key
+        self.instance = instance
+        self.size_bytes = size_bytes
+        self.pinned = pinned
+        # seconds without use after which the entry is evicted, None keeps it until memory pressure
+        self.idle_ttl = idle_ttl
+        self.loaded_at = time.time()
+        self.last_used = self.loaded_at
+        self.hits = 0
+        self.in_use = 0
+
+    def touch(self):
+        self.last_used = time.time()
+        self.hits += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "key": self.key,
+            "bytes": self.size_bytes,
+            "pinned": self.pinned,
+            "idle_ttl": self.idle_ttl,
+            "hits": self.hits,
+            "in_use": self.in_use,
+            "loaded_at": self.loaded_at,
+            "last_used": self.last_used,
+        }
+
+
+class ModelCache:
+    """
+    LRU cache of loaded model instances.
+    Entries are kept in least-recently-used order, pinned entries are never
+    offered for eviction.
+    """
+
+    def __init__(self):
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def keys(self) -> List[str]:
+        return list(self._entries.keys())
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        """Returns the entry and marks it as most recently used."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        entry.touch()
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def peek(self, key: str) -> Optional[CacheEntry]:
+        """Returns the entry without touching its LRU position."""
+        return self._entries.get(key)
+
+    def put(self, key: str, instance: Any, size_bytes: int, pinned: bool = False, idle_ttl: Optional[float] = None) -> CacheEntry:
+        entry = CacheEntry(key, instance, size_bytes, pinned=pinned, idle_ttl=idle_ttl)
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        return entry
+
+    def pop(self, key: str) -> Optional[CacheEntry]:
+        return self._entries.pop(key, None)
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(entry.size_bytes for entry in self._entries.values())
+
+    def eviction_candidates(self, required_bytes: int, exclude: Iterable[str] = ()) -> List[str]:
+        """
+        Returns least-recently-used keys that are neither pinned nor in use and
+        whose combined size covers required_bytes (or every candidate if that
+        is not possible).
+        """
+        exclude = set(exclude)
+        to_evict = []
+        freed = 0
+        for key, entry in self._entries.items():
+            if freed >= required_bytes:
+                break
+            if entry.pinned or entry.in_use or key in exclude:
+                continue
+            to_evict.append(key)
+            freed += entry.size_bytes
+        return to_evict
+
+    def idle_keys(self, now: Optional[float] = None) -> List[str]:
+        """Keys idle for longer than their idle_ttl, pinned and in-use entries excluded."""
+        now = now or time.time()
+        return [
+            key for key, entry in self._entries.items()
+            if entry.idle_ttl is not None
+            and not entry.pinned
+            and not entry.in_use
+            and now - entry.last_used > entry.idle_ttl
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "resident": [entry.to_dict() for entry in self._entries.values()],
+            "resident_bytes": self.total_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
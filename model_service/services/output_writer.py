@@ -0,0 +1,93 @@
+import os
+import time
+import queue
+import logging
+import threading
+from collections import defaultdict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Intermediate outputs waiting to be written before submit() blocks the inference thread
+OUTPUT_WRITER_QUEUE_SIZE = int(os.getenv("OUTPUT_WRITER_QUEUE_SIZE", "8"))
+
+_queue = queue.Queue(maxsize=OUTPUT_WRITER_QUEUE_SIZE)
+_thread = None
+_thread_lock = threading.Lock()
+
+_pending = defaultdict(int)
+_pending_changed = threading.Condition()
+
+_timings = defaultdict(lambda: {"count": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+_timings_lock = threading.Lock()
+
+
+def _record(stage: str, seconds: float):
+    with _timings_lock:
+        timing = _timings[stage]
+        timing["count"] += 1
+        timing["total_seconds"] += seconds
+        timing["max_seconds"] = max(timing["max_seconds"], seconds)
+
+
+def _worker():
+    while True:
+        job_id, stages, queued_at = _queue.get()
+        _record("queue_wait", time.perf_counter() - queued_at)
+        try:
+            for stage, fn in stages:
+                started = time.perf_counter()
+                try:
+                    fn()
+                except Exception as e:
+                    logger.warning(f"Output writer stage {stage} failed for job {job_id}: {e}")
+                finally:
+                    _record(stage, time.perf_counter() - started)
+        finally:
+            with _pending_changed:
+                _pending[job_id] -= 1
+                if _pending[job_id] <= 0:
+                    del _pending[job_id]
+                _pending_changed.notify_all()
+            _queue.task_done()
+
+
+def _ensure_started():
+    global _thread
+    with _thread_lock:
+        if _thread is None or not _thread.is_alive():
+            _thread = threading.Thread(target=_worker, name="output-writer", daemon=True)
+            _thread.start()
+
+
+def submit(job_id, *stages):
+    """
+    Queues (stage_name, callable) pairs to run in order on the writer thread,
+    e.g. PNG-encoding an intermediate image and then notifying the backend.
+    Blocks while the queue is full so a slow disk or backend applies backpressure.
+    """
+    _ensure_started()
+    with _pending_changed:
+        _pending[job_id] += 1
+    _queue.put((job_id, stages, time.perf_counter()))
+
+
+def flush(job_id, timeout: float = None) -> bool:
+    """Waits until everything queued for job_id has been written. Returns False on timeout."""
+    started = time.perf_counter()
+    with _pending_changed:
+        done = _pending_changed.wait_for(lambda: _pending.get(job_id, 0) == 0, timeout=timeout)
+    _record("flush_wait", time.perf_counter() - started)
+    return done
+
+
+def writer_stats():
+    with _timings_lock:
+        stages = {stage: dict(timing) for stage, timing in _timings.items()}
+    return {
+        "queued": _queue.qsize(),
+        "capacity": OUTPUT_WRITER_QUEUE_SIZE,
+        "stages": stages,
+    }
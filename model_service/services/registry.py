@@ -1,49 +1,91 @@
 import yaml
 import os
+import dotenv
+import inspect
+import importlib
+import functools
+import threading
+import time
 import torch
+from contextlib import contextmanager
 from typing import Dict, Any
 from fastapi import HTTPException
 
-from stable_diffusion.controlnet import ControlNet
-from stable_diffusion.specifics.realistic_vision import RealisticVision
-from stable_diffusion.specifics.cyberrealistic import CyberRealistic
-from stable_diffusion.specifics.lustify_sdxl import LustifySDXL
-from stable_diffusion.specifics.illustrious import IllustriousPony
-from stable_diffusion.sd_inpaint_base import UnifiedInpaintModel
-from stable_diffusion.sdxl_inpaint_base import SDXLInpaintModel
-from auto_segmentation.SAM import SAMSegmenter
-from upscalers.realesrganupscaler import RealESRGANUpscaler
-from stable_diffusion.sdxl_t2i_base import SDXLTextToImageModel
-from stable_diffusion.t2i_base import SDTextToImageModel
+from services.model_cache import ModelCache
 
+# Wrapper classes by models.yaml name, as "module.Class" paths. A wrapper (and
+# the diffusers / segment_anything / realesrgan stack behind it) is imported
+# only when a model using it is instantiated for the first time.
 CLASS_MAP = {
-    "ControlNetModelWrapper": ControlNet,
-    "RealisticVisionModelWrapper": RealisticVision,
-    "CyberRealisticModelWrapper": CyberRealistic,
-    "LustifyModelWrapper": LustifySDXL,
-    "IllustriousPonyModelWrapper": IllustriousPony,
-    "SDXLInpaintModelWrapper": SDXLInpaintModel,
-    "UnifiedInpaintModelWrapper": UnifiedInpaintModel,
+    "ControlNetModelWrapper": "stable_diffusion.controlnet.ControlNet",
+    "SDXLInpaintModelWrapper": "stable_diffusion.sdxl_inpaint_base.SDXLInpaintModel",
+    "UnifiedInpaintModelWrapper": "stable_diffusion.sd_inpaint_base.UnifiedInpaintModel",
     
-    "RealESRGANUpscalerWrapper": RealESRGANUpscaler,
+    "RealESRGANUpscalerWrapper": "upscalers.realesrganupscaler.RealESRGANUpscaler",
     
-    "SamModelWrapper": SAMSegmenter,
+    "SamModelWrapper": "auto_segmentation.SAM.SAMSegmenter",
 
-    "SDTextToImageModelWrapper": SDTextToImageModel,
-    "SDXLTextToImageModelWrapper": SDXLTextToImageModel,
+    "SDTextToImageModelWrapper": "stable_diffusion.t2i_base.SDTextToImageModel",
+    "SDXLTextToImageModelWrapper": "stable_diffusion.sdxl_t2i_base.SDXLTextToImageModel",
 }
-import dotenv
-import os
-import logging
+
+_loaded_classes: Dict[str, Any] = {}
+
+
+def load_class(class_name: str):
+    """Imports and returns the wrapper class registered under class_name."""
+    if class_name not in CLASS_MAP:
+        raise ValueError(f"Unknown class: {class_name}")
+    if class_name not in _loaded_classes:
+        module_path, attr = CLASS_MAP[class_name].rsplit(".", 1)
+        _loaded_classes[class_name] = getattr(importlib.import_module(module_path), attr)
+    return _loaded_classes[class_name]
 
 
 dotenv.load_dotenv()
 
 
+GB = 1024**3
+
+# Pipeline kinds an instance can be cached under, a model may be resident in several at once.
+INPAINT = "inpaint"
+T2I = "t2i"
+SEGMENTATION = "segmentation"
+UPSCALER = "upscaler"
+KINDS = (INPAINT, T2I, SEGMENTATION, UPSCALER)
+
+# Segmentation and upscaler models leave the device after this many idle seconds
+# unless models.yaml sets `idle_ttl` (null keeps them until memory pressure).
+AUX_MODEL_IDLE_TTL = float(os.getenv("AUX_MODEL_IDLE_TTL", "600"))
+IDLE_REAPER_INTERVAL = float(os.getenv("IDLE_REAPER_INTERVAL", "30"))
+
+
+def _synchronized(method):
+    """Serializes access to the registry state (loading, eviction, bookkeeping)."""
+    @functools.wraps(method)
+    def wrapper(cls, *args, **kwargs):
+        with cls._lock:
+            return method(cls, *args, **kwargs)
+    return wrapper
+
+
 class ModelManager:
-    _instances: Dict[str, Any] = {}
-    _is_t2i = False
+    _lock = threading.RLock()
+    # One lock per cached instance, a pipeline must not run two requests at once
+    _instance_locks: Dict[str, threading.Lock] = {}
+    # One lock per key being loaded, so a slow load never holds the registry lock
+    _load_locks: Dict[str, threading.Lock] = {}
+    # Bytes set aside for loads in progress, counted as used by _get_free_bytes
+    _reserved: Dict[str, float] = {}
+    # Entries taken off the device whose weights are still being copied to the host
+    _evicting: Dict[str, Any] = {}
+    _load_generation = 0
+    _cache = ModelCache()
+    # Second tier: evicted instances parked in host RAM, moved back to the device on demand
+    _host_cache = ModelCache()
+    _footprints: Dict[str, int] = {}
     _model_map: Dict[str, Any] = {}
+    _reaper = None
 
     @classmethod
     def load_config(cls, config_path: str = None):
@@ -73,6 +115,33 @@ class ModelManager:
     def list_upscalers(cls):
         return list(cls._upscaler_map.keys())
 
+    @classmethod
+    def preload_plan(cls) -> list:
+        """
+        Returns (kind, model_name) pairs marked with `preload` in models.yaml,
+        ordered by `preload_priority` (lower loads first, default 100).
+        `preload: true` loads the default kind of a section, a model entry may
+        also list kinds explicitly, e.g. `preload: [inpaint, t2i]`.
+        """
+        sections = [
+            (cls._model_map, INPAINT),
+            (cls._auto_segmantation_map, SEGMENTATION),
+            (cls._upscaler_map, UPSCALER),
+        ]
+        plan = []
+        for section, default_kind in sections:
+            for name, info in section.items():
+                preload = info.get("preload")
+                if not preload:
+                    continue
+                kinds = preload if isinstance(preload, list) else [default_kind]
+                for kind in kinds:
+                    plan.append((info.get("preload_priority", 100), kind, name))
+        plan.sort(key=lambda item: item[0])
+        return [(kind, name) for _, kind, name in plan]
+
+    # ---------------- memory accounting ----------------
+
     @staticmethod
     def _get_free_vram_gb() -> float:
         """ Returns free VRAM in GB."""
@@ -81,53 +150,414 @@ class ModelManager:
         free, total = torch.cuda.mem_get_info()
         return free / (1024**3)  
 
+    @classmethod
+    def _get_free_bytes(cls) -> float:
+        """
+        Returns memory available for another model.
+        MODEL_CACHE_BUDGET_GB caps the bytes held by resident models on any device,
+        on CUDA the real free memory is honoured as well. Without either limit
+        there is no memory pressure.
+        """
+        limits = []
+        reserved = sum(cls._reserved.values())
+        budget_gb = os.getenv("MODEL_CACHE_BUDGET_GB")
+        if budget_gb:
+            evicting = sum(entry.size_bytes for entry in cls._evicting.values())
+            limits.append(float(budget_gb) * GB - cls._cache.total_bytes - reserved - evicting)
+        if torch.cuda.is_available():
+            # loads in progress have not allocated all of their weights yet
+            limits.append(cls._get_free_vram_gb() * GB - reserved)
+        if not limits:
+            return float("inf")
+        return min(limits)
+
+    @staticmethod
+    def _host_budget_bytes() -> float:
+        """RAM budget of the host staging tier, HOST_CACHE_BUDGET_GB=0 disables it."""
+        return float(os.getenv("HOST_CACHE_BUDGET_GB", "16")) * GB
+
+    @staticmethod
+    def _allocated_bytes() -> int:
+        if not torch.cuda.is_available():
+            return 0
+        return torch.cuda.memory_allocated()
+
+    @staticmethod
+    def _instance_modules(instance):
+        """Yields torch modules held by a wrapper (diffusers pipeline, SAM, RealESRGANer)."""
+        for value in vars(instance).values():
+            if isinstance(value, torch.nn.Module):
+                yield value
+            elif hasattr(value, "components"):
+                for component in value.components.values():
+                    if isinstance(component, torch.nn.Module):
+                        yield component
+            elif isinstance(getattr(value, "model", None), torch.nn.Module):
+                yield value.model
+
+    @classmethod
+    def _module_bytes(cls, *instances) -> int:
+        """Sums the sizes of parameters and buffers of instances, counting shared tensors once."""
+        seen = set()
+        total = 0
+        modules = [module for instance in instances for module in cls._instance_modules(instance)]
+        for module in modules:
+            for tensor in list(module.parameters()) + list(module.buffers()):
+                ptr = tensor.data_ptr()
+                if ptr in seen:
+                    continue
+                seen.add(ptr)
+                total += tensor.numel() * tensor.element_size()
+        return total
+
+    @classmethod
+    def _measure_footprint(cls, instance, allocated_before: int, shared_with=None) -> int:
+        """
+        Measures the resident memory of a freshly loaded instance, from the
+        allocator delta unless allocated_before is None (concurrent loads).
+        Weights borrowed from shared_with are not counted again.
+        """
+        if allocated_before is not None:
+            delta = cls._allocated_bytes() - allocated_before
+            if delta > 0:
+                return delta
+        size = cls._module_bytes(instance)
+        if shared_with is not None:
+            combined = cls._module_bytes(instance, shared_with)
+            size = max(0, combined - cls._module_bytes(shared_with))
+        return size
+
+    @classmethod
+    def _required_bytes(cls, key: str, model_info: dict, default_vram: float) -> float:
+        """Uses the footprint measured on a previous load, the models.yaml estimate otherwise."""
+        if key in cls._footprints:
+            return cls._footprints[key]
+        required_vram = model_info.get("required_vram") or default_vram
+        return float(required_vram) * GB
+
+    @classmethod
+    def _make_room(cls, key: str, model_info: dict, default_vram: float = 10, keep=()) -> list:
+        """
+        Takes models off the device until key fits. Caller holds the registry
+        lock and passes the returned entries to _finish_evict once it released it.
+        """
+        required = cls._required_bytes(key, model_info, default_vram)
+        free = cls._get_free_bytes()
+        if free >= required:
+            return []
+
+        evicted = []
+        for name in cls._find_models_to_unload(required - free, exclude=keep):
+            if name not in cls._cache:
+                # already taken as the sibling of an earlier candidate
+                continue
+            group = [name] + cls._siblings(name)
+            entries = [cls._cache.peek(k) for k in group]
+            # a pinned sibling keeps the whole group that shares its modules
+            if any(e is not None and (e.in_use or e.pinned) for e in entries):
+                continue
+            for entry in cls._begin_evict(group):
+                print(f"Evicting {entry.key} to free memory for {key}")
+                evicted.append(entry)
+        return evicted
+
+    @classmethod
+    def _siblings(cls, key: str) -> list:
+        """Resident keys whose instances share modules with key, they have to leave the device together."""
+        entry = cls._cache.peek(key)
+        if entry is None:
+            return []
+        modules = {id(module) for module in cls._instance_modules(entry.instance)}
+        siblings = []
+        for other_key in cls._cache.keys():
+            if other_key == key:
+                continue
+            other = cls._cache.peek(other_key).instance
+            if any(id(module) in modules for module in cls._instance_modules(other)):
+                siblings.append(other_key)
+        return siblings
+
+    @classmethod
+    def _begin_evict(cls, group: list) -> list:
+        """
+        Takes a group of resident keys off the device tier and returns their
+        entries. Caller holds the registry lock. Each key's load lock stays held
+        until _finish_evict, so a getter waits for the copy and then restores
+        from the host tier instead of loading from disk. Nothing is taken when
+        a key of the group is being loaded or restored right now.
+        """
+        taken = []
+        for key in group:
+            load_lock = cls._load_locks.setdefault(key, threading.Lock())
+            if not load_lock.acquire(blocking=False):
+                for other in taken:
+                    cls._load_locks[other].release()
+                return []
+            taken.append(key)
+
+        entries = []
+        for key in group:
+            entry = cls._cache.pop(key)
+            if entry is None:
+                cls._load_locks[key].release()
+                continue
+            cls._cache.evictions += 1
+            cls._evicting[key] = entry
+            entries.append(entry)
+        if entries:
+            # freeing device memory skews the allocator delta of loads in progress
+            cls._load_generation += 1
+        return entries
+
+    @classmethod
+    def _finish_evict(cls, entries: list):
+        """
+        Moves entries taken by _begin_evict to the host tier, or drops those
+        that do not fit there. The device -> host copy runs outside the registry
+        lock, so use() of other models is not stalled by it.
+        """
+        budget = cls._host_budget_bytes()
+        for entry in entries:
+            dropped = []
+            try:
+                if entry.size_bytes > budget:
+                    entry.instance.unload_model()
+                    continue
+
+                cls._move_instance(entry.instance, "cpu")
+                with cls._lock:
+                    staged = cls._host_cache.put(
+                        entry.key, entry.instance, entry.size_bytes, pinned=entry.pinned, idle_ttl=entry.idle_ttl
+                    )
+                    staged.hits = entry.hits
+
+                    overflow = cls._host_cache.total_bytes - budget
+                    if overflow > 0:
+                        for name in cls._host_cache.eviction_candidates(overflow, exclude=[entry.key]):
+                            print(f"Dropping {name} from host memory")
+                            dropped.append(cls._host_cache.pop(name))
+                            cls._host_cache.evictions += 1
+            except Exception as e:
+                # the entry is already off the device tier, it is reloaded from disk when needed
+                print(f"[WARN] Could not stage {entry.key} in host memory: {e}")
+            finally:
+                with cls._lock:
+                    cls._evicting.pop(entry.key, None)
+                cls._load_locks[entry.key].release()
+            for staged_entry in dropped:
+                staged_entry.instance.unload_model()
+
+    @classmethod
+    def _move_instance(cls, instance, device: str):
+        """
+        Moves every module of an instance to device. Weights moved to the host
+        are pinned when CUDA is available so the way back is a fast async copy.
+        """
+        pin = device == "cpu" and torch.cuda.is_available()
+        if device == "cpu" and hasattr(instance, "release_device_caches"):
+            # device tensors held outside the modules (SAM image embeddings) would not move with them
+            instance.release_device_caches()
+        for module in cls._instance_modules(instance):
+            module.to(device, non_blocking=True)
+            if not pin:
+                continue
+            try:
+                for tensor in list(module.parameters()) + list(module.buffers()):
+                    tensor.data = tensor.data.pin_memory()
+            except RuntimeError as e:
+                print(f"[WARN] Could not pin host memory: {e}")
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+            if device == "cpu":
+                torch.cuda.empty_cache()
+
+    @staticmethod
+    def _key(model_name: str, kind: str) -> str:
+        return f"{model_name}/{kind}"
+
+    @classmethod
+    def _register(cls, key: str, instance, model_info: dict, allocated_before: int, shared_with=None, idle_ttl=None):
+        size = cls._measure_footprint(instance, allocated_before, shared_with)
+        cls._footprints[key] = size
+        cls._cache.put(
+            key,
+            instance,
+            size,
+            pinned=bool(model_info.get("pin", False)),
+            idle_ttl=model_info.get("idle_ttl", idle_ttl),
+        )
+        print(f"Loaded {key} ({size / GB:.2f} GB resident)")
+        return instance
+
+    @classmethod
+    def _get_resident(cls, key: str):
+        """Returns a device-resident instance. Caller holds the registry lock."""
+        entry = cls._cache.get(key)
+        return entry.instance if entry is not None else None
+
+    @classmethod
+    def _restore_staged(cls, key: str):
+        """
+        Moves an instance staged in the host tier back to the device.
+        Caller holds the key's load lock, the copy itself runs outside the registry lock.
+        """
+        with cls._lock:
+            staged = cls._host_cache.pop(key)
+            if staged is None:
+                cls._host_cache.misses += 1
+                return None
+            cls._host_cache.hits += 1
+            evicted = cls._make_room(key, {"required_vram": staged.size_bytes / GB})
+            cls._reserved[key] = staged.size_bytes
+
+        instance = staged.instance
+        print(f"Restoring {key} from host memory")
+        try:
+            cls._finish_evict(evicted)
+            cls._move_instance(instance, getattr(instance, "device", "cpu"))
+        finally:
+            with cls._lock:
+                cls._reserved.pop(key, None)
+
+        with cls._lock:
+            entry = cls._cache.put(
+                key, instance, staged.size_bytes, pinned=staged.pinned, idle_ttl=staged.idle_ttl
+            )
+            entry.hits = staged.hits + 1
+        return instance
+
+    @classmethod
+    def _get_or_load(cls, key: str, model_info: dict, build, default_vram: float = 10, donor=None, idle_ttl=None):
+        """
+        Returns the instance cached under key, restoring or loading it otherwise.
+        Loading holds only a per-key lock: the registry lock is taken for the
+        bookkeeping around it, so other models, /cache and /health are not
+        blocked while a checkpoint loads.
+        build(donor_instance) creates and loads the instance.
+        donor: (donor_key, model_class) of a resident instance that may lend weights.
+        """
+        with cls._lock:
+            instance = cls._get_resident(key)
+            if instance is not None:
+                return instance
+            load_lock = cls._load_locks.setdefault(key, threading.Lock())
+
+        with load_lock:
+            with cls._lock:
+                instance = cls._get_resident(key)
+            if instance is not None:
+                return instance
+
+            instance = cls._restore_staged(key)
+            if instance is not None:
+                return instance
+
+            with cls._lock:
+                donor_entry = None
+                if donor is not None:
+                    donor_key, model_class = donor
+                    if cls._shared_donor(donor_key, model_class) is not None:
+                        donor_entry = cls._cache.peek(donor_key)
+                        # the donor may not leave the device while its weights are borrowed
+                        donor_entry.in_use += 1
+                        print(f"Sharing weights of {donor_key}")
+                keep = [donor_entry.key] if donor_entry is not None else ()
+                evicted = cls._make_room(key, model_info, default_vram=default_vram, keep=keep)
+                cls._reserved[key] = cls._required_bytes(key, model_info, default_vram)
+                # a concurrent load of another model skews the allocator delta
+                concurrent = len(cls._reserved) > 1
+                load_generation = cls._load_generation = cls._load_generation + 1
+                allocated_before = cls._allocated_bytes()
+
+            try:
+                if evicted:
+                    cls._finish_evict(evicted)
+                    # the copies freed device memory, measure the load from here on
+                    with cls._lock:
+                        concurrent = concurrent or len(cls._reserved) > 1
+                        load_generation = cls._load_generation
+                        allocated_before = cls._allocated_bytes()
+                instance = build(donor_entry.instance if donor_entry is not None else None)
+            finally:
+                with cls._lock:
+                    cls._reserved.pop(key, None)
+                    if donor_entry is not None:
+                        donor_entry.in_use -= 1
+
+            with cls._lock:
+                concurrent = concurrent or bool(cls._reserved) or cls._load_generation != load_generation
+                return cls._register(
+                    key,
+                    instance,
+                    model_info,
+                    None if concurrent else allocated_before,
+                    shared_with=donor_entry.instance if donor_entry is not None else None,
+                    idle_ttl=idle_ttl,
+                )
+
+    @classmethod
+    def cache_stats(cls) -> Dict[str, Any]:
+        with cls._lock:
+            stats = cls._cache.stats()
+            stats["host"] = cls._host_cache.stats()
+            stats["loading"] = sorted(cls._reserved)
+            stats["evicting"] = sorted(cls._evicting)
+        free = cls._get_free_bytes()
+        stats["free_bytes"] = None if free == float("inf") else free
+        stats["host"]["budget_bytes"] = cls._host_budget_bytes()
+        return stats
+
+    # ---------------- loading ----------------
+
     @classmethod
     def get_model(cls, model_name: str, t2i=False):
         if model_name not in cls._model_map:
             raise ValueError(f"Unknown model: {model_name}")
 
-        if model_name not in cls._instances or cls._is_t2i is not t2i :
-            model_info = cls._model_map[model_name]
-            if t2i and model_info.get("class_t2i"):
-                model_class_name = model_info["class_t2i"]
-            elif t2i:
-                raise ValueError(f"Model does not support text to image pipeline: {model_name}")
-            else:
-                model_class_name = model_info["class"]
-            model_path = model_info["path"]
-            
-            print(f"Loading {model_class_name}")
-
-            required_vram = model_info.get("required_vram")
-            if not required_vram:
-                required_vram = 10
+        kind = T2I if t2i else INPAINT
+        key = cls._key(model_name, kind)
+        model_info = cls._model_map[model_name]
+        if t2i and model_info.get("class_t2i"):
+            model_class_name = model_info["class_t2i"]
+        elif t2i:
+            raise ValueError(f"Model does not support text to image pipeline: {model_name}")
+        else:
+            model_class_name = model_info["class"]
+        model_path = model_info["path"]
+        model_class = load_class(model_class_name)
 
-            free_gb = cls._get_free_vram_gb()
-            if free_gb < float(required_vram):
-                models = cls._find_models_to_unload(required_vram - free_gb)
-                if models:
-                    for m in models:
-                        cls.unload_model(m)
-                    free_gb = cls._get_free_vram_gb()
+        def build(donor):
+            print(f"Loading {model_class_name}")
 
             extra_kwargs = {}
             if "vae" in model_info:
                 extra_kwargs["vae_path"] = model_info.get("vae")
             if "controlnet_path" in model_info:
                 extra_kwargs["controlnet_path"] = model_info.get("controlnet_path")
+            if donor is not None:
+                extra_kwargs["shared_pipeline"] = donor.pipeline
 
-            if model_class_name not in CLASS_MAP:
-                raise ValueError(f"Unknown class: {model_class_name}")
-
-            model_class = CLASS_MAP[model_class_name]
             instance = model_class()
             instance.load_model(
                 model_path,
                 **extra_kwargs,
             )
-            cls._instances[model_name] = instance
+            return instance
+
+        # Both kinds come from the same checkpoint, so a resident pipeline of
+        # the other kind can lend its UNet, VAE and text encoders.
+        donor_key = cls._key(model_name, T2I if kind == INPAINT else INPAINT)
+        return cls._get_or_load(key, model_info, build, donor=(donor_key, model_class))
 
-        return cls._instances[model_name]
+    @classmethod
+    def _shared_donor(cls, donor_key: str, model_class):
+        """Returns the resident instance under donor_key if model_class can borrow its weights."""
+        if "shared_pipeline" not in inspect.signature(model_class.load_model).parameters:
+            return None
+        entry = cls._cache.peek(donor_key)
+        if entry is None or getattr(entry.instance, "pipeline", None) is None:
+            return None
+        return entry.instance
     
     @classmethod
     def get_auto_segmentation_model(cls, model_name: str):
@@ -138,106 +568,158 @@ class ModelManager:
         model_class_name = model_info["class"]
         model_path = model_info["path"]
         model_type = model_info["type"]
-        required_vram = model_info.get("required_vram", 8)
-
-        free_gb = cls._get_free_vram_gb()
-        if free_gb < float(required_vram):
-            models = cls._find_models_to_unload(required_vram - free_gb)
-            if models:
-                for m in models:
-                    cls.unload_model(m)
-                free_gb = cls._get_free_vram_gb()
-
-        if model_class_name not in CLASS_MAP:
-            raise ValueError(f"Unknown class: {model_class_name}")
-        model_class = CLASS_MAP[model_class_name]
-        instance = model_class(model_type=model_type)
-
-        instance.load_model(model_path)
-
-        cls._instances[model_name] = instance
 
+        def build(donor):
+            model_class = load_class(model_class_name)
+            instance = model_class(
+                model_type=model_type,
+                tiers=model_info.get("tiers"),
+                default_tier=model_info.get("default_tier"),
+            )
+            instance.load_model(model_path)
+            return instance
 
-        return cls._instances[model_name]
+        return cls._get_or_load(
+            cls._key(model_name, SEGMENTATION), model_info, build, default_vram=8, idle_ttl=AUX_MODEL_IDLE_TTL
+        )
     
 
     @classmethod
     def get_upscaler(cls, model_name: str):
         if model_name not in cls._upscaler_map:
             raise ValueError(f"Unknown upscaler: {model_name}")
-        
+
         model_info = cls._upscaler_map[model_name]
         model_class_name = model_info["class"]
         model_path = model_info["path"]
-        required_vram = model_info.get("required_vram", 8)
-
-        free_gb = cls._get_free_vram_gb()
-        if free_gb < float(required_vram):
-            models = cls._find_models_to_unload(required_vram - free_gb)
-            if models:
-                for m in models:
-                    cls.unload_model(m)
-                free_gb = cls._get_free_vram_gb()
-
-        if model_class_name not in CLASS_MAP:
-            raise ValueError(f"Unknown class: {model_class_name}")
-        model_class = CLASS_MAP[model_class_name]
-        instance = model_class()
-
-        num_block = model_info.get("num_block", 23)
-        num_feat = model_info.get("num_feat", 64)
-        num_grow_ch = model_info.get("num_grow_ch", 32)
-        scale = model_info.get("scale", 4)
-
-        instance.load_model(
-            model_path=model_path,
-            model_name=model_name,
-            scale=scale,
-            num_block=num_block,
-            num_feat=num_feat,
-            num_grow_ch=num_grow_ch
+
+        def build(donor):
+            model_class = load_class(model_class_name)
+            instance = model_class()
+
+            num_block = model_info.get("num_block", 23)
+            num_feat = model_info.get("num_feat", 64)
+            num_grow_ch = model_info.get("num_grow_ch", 32)
+            scale = model_info.get("scale", 4)
+
+            instance.load_model(
+                model_path=model_path,
+                model_name=model_name,
+                scale=scale,
+                num_block=num_block,
+                num_feat=num_feat,
+                num_grow_ch=num_grow_ch,
+                tile=model_info.get("tile"),
+                tile_pad=model_info.get("tile_pad", 10),
+            )
+            return instance
+
+        return cls._get_or_load(
+            cls._key(model_name, UPSCALER), model_info, build, default_vram=8, idle_ttl=AUX_MODEL_IDLE_TTL
         )
 
-        cls._instances[model_name] = instance
-        return cls._instances[model_name]
+    @classmethod
+    def evict_idle(cls) -> list:
+        """
+        Moves instances idle past their idle_ttl to the host tier, and drops
+        staged instances that stayed idle there for another idle_ttl.
+        """
+        to_evict = []
+        dropped = []
+        with cls._lock:
+            for key in cls._cache.idle_keys():
+                if key not in cls._cache:
+                    continue
+                group = [key] + cls._siblings(key)
+                if any(cls._cache.peek(k).in_use or cls._cache.peek(k).pinned for k in group):
+                    continue
+                for entry in cls._begin_evict(group):
+                    print(f"Evicting idle {entry.key}")
+                    to_evict.append(entry)
+            for key in cls._host_cache.idle_keys():
+                print(f"Dropping idle {key} from host memory")
+                dropped.append(cls._host_cache.pop(key))
+                cls._host_cache.evictions += 1
+
+        cls._finish_evict(to_evict)
+        for entry in dropped:
+            entry.instance.unload_model()
+        return [entry.key for entry in to_evict + dropped]
+
+    @classmethod
+    def start_idle_reaper(cls, interval: float = IDLE_REAPER_INTERVAL):
+        """Runs evict_idle every interval seconds on a daemon thread."""
+        if cls._reaper is not None and cls._reaper.is_alive():
+            return
+
+        def _run():
+            while True:
+                time.sleep(interval)
+                try:
+                    cls.evict_idle()
+                except Exception as e:
+                    print(f"[WARN] Idle eviction failed: {e}")
+
+        cls._reaper = threading.Thread(target=_run, name="model-idle-reaper", daemon=True)
+        cls._reaper.start()
+
+    @classmethod
+    @_synchronized
+    def unload_model(cls, model_name: str, kind: str = None):
+        """Unloads one pipeline kind of a model, or every kind when kind is None."""
+        kinds = [kind] if kind else KINDS
+        for k in kinds:
+            cls._unload_key(cls._key(model_name, k))
+
+    @classmethod
+    def _unload_key(cls, key: str):
+        for cache in (cls._cache, cls._host_cache):
+            entry = cache.pop(key)
+            if entry is not None:
+                entry.instance.unload_model()
 
     @classmethod
-    def unload_model(cls, model_name: str):
-        if model_name in cls._instances:
-            cls._instances[model_name].unload_model()
-            del cls._instances[model_name]
+    @contextmanager
+    def use(cls, kind: str, model_name: str):
+        """
+        Context manager giving exclusive access to a model instance.
+        The instance lock is held for the duration of the block, and the
+        instance cannot be evicted while it is in use.
+        """
+        getters = {
+            INPAINT: cls.get_model,
+            T2I: functools.partial(cls.get_model, t2i=True),
+            SEGMENTATION: cls.get_auto_segmentation_model,
+            UPSCALER: cls.get_upscaler,
+        }
+        key = cls._key(model_name, kind)
+        while True:
+            # loading happens outside the registry lock, the instance may be
+            # evicted again before it is marked in use
+            instance = getters[kind](model_name)
+            with cls._lock:
+                entry = cls._cache.peek(key)
+                if entry is None or entry.instance is not instance:
+                    continue
+                entry.in_use += 1
+                lock = cls._instance_locks.setdefault(key, threading.Lock())
+                break
+        try:
+            with lock:
+                yield instance
+        finally:
+            with cls._lock:
+                entry.in_use -= 1
 
     @classmethod
     def switch_model(cls, old_model: str, new_model: str):
+        """Returns new_model, the old one stays cached and is evicted only under memory pressure."""
         if old_model == new_model:
             return cls.get_model(old_model)
-        cls.unload_model(old_model)
         return cls.get_model(new_model)
     
     @classmethod
-    def _find_models_to_unload(cls, required_vram: float) -> list:
-        """Finds models to unload to free up the required VRAM."""
-
-        combined_map = {}
-        combined_map.update(cls._model_map)
-        combined_map.update(cls._auto_segmantation_map)
-        combined_map.update(cls._upscaler_map)
-
-        sorted_models = sorted(
-            cls._instances.items(),
-            key=lambda item: combined_map.get(item[0], {}).get("required_vram", 10),
-            reverse=True
-        )
-
-        to_unload = []
-        freed_vram = 0.0
-
-        for model_name, instance in sorted_models:
-            model_info = combined_map.get(model_name, {})
-            model_vram = model_info.get("required_vram", 10)
-            to_unload.append(model_name)
-            freed_vram += model_vram
-            if freed_vram >= required_vram:
-                break
+    def _find_models_to_unload(cls, required_bytes: float, exclude=()) -> list:
+        """Finds least recently used, non-pinned models to unload to free up the required memory."""
+        return cls._cache.eviction_candidates(required_bytes, exclude=exclude)
 
-        return to_unload
@@ -0,0 +1,37 @@
+import os
+import uuid
+from PIL import Image
+from dotenv import load_dotenv
+from services.registry import ModelManager, UPSCALER
+from services.editing_services import convert_system_path_to_url
+
+load_dotenv()
+
+BASE_MEDIA_ROOT = os.getenv("MEDIA_ROOT", "/data/media")
+MEDIA_ROOT = os.path.join(BASE_MEDIA_ROOT, "upscaled")
+
+# Outputs of at least this many pixels are streamed to disk strip by strip (0 streams everything)
+UPSCALE_STREAM_MIN_PIXELS = int(os.getenv("UPSCALE_STREAM_MIN_PIXELS", str(4096 * 4096)))
+
+
+def upscale_image_file(image: Image.Image, model: str, stream: bool = None) -> str:
+    """
+    Upscales image with the given upscaler and returns the media URL of the result.
+    Large outputs are written as a row-streamed PNG instead of being assembled in memory.
+    """
+    filename = f"upscaled_{uuid.uuid4().hex}.png"
+    output_path = os.path.join(MEDIA_ROOT, filename)
+
+    os.makedirs(MEDIA_ROOT, exist_ok=True)
+
+    with ModelManager.use(UPSCALER, model) as upscaler:
+        if stream is None:
+            output_pixels = image.width * image.height * getattr(upscaler, "scale", 4) ** 2
+            stream = output_pixels >= UPSCALE_STREAM_MIN_PIXELS
+        if stream and hasattr(upscaler, "upscale_to_file"):
+            upscaler.upscale_to_file(image, output_path)
+            return convert_system_path_to_url(output_path)
+        upscaled = upscaler.upscale(image)
+
+    upscaled.save(output_path)
+    return convert_system_path_to_url(output_path)
@@ -0,0 +1,84 @@
+import time
+import logging
+from typing import Any, Dict
+from PIL import Image
+from services.registry import ModelManager, INPAINT, T2I, SEGMENTATION, UPSCALER
+from services.inference_executor import submit_preload
+
+logger = logging.getLogger(__name__)
+
+# key -> {"status": pending | loading | warm | failed, "seconds": float, "error": str}
+_state: Dict[str, Dict[str, Any]] = {}
+
+
+def _warm_inpaint(instance):
+    image = Image.new("RGB", (256, 256), color=(127, 127, 127))
+    mask = Image.new("L", (256, 256), color=255)
+    instance.generate_image(
+        job_id=None,
+        prompt="warm-up",
+        init_image=image,
+        mask_image=mask,
+        steps=2,
+        strength=1.0,
+    )
+
+
+def _warm_t2i(instance):
+    instance.generate_images(
+        job_ids=[None],
+        prompts=["warm-up"],
+        negative_prompts=[""],
+        seeds=[0],
+        width=256,
+        height=256,
+        steps=2,
+    )
+
+
+def _warm_segmentation(instance):
+    instance.auto_segment(Image.new("RGB", (64, 64)))
+
+
+def _warm_upscaler(instance):
+    instance.upscale(Image.new("RGB", (32, 32)))
+
+
+WARMUPS = {
+    INPAINT: _warm_inpaint,
+    T2I: _warm_t2i,
+    SEGMENTATION: _warm_segmentation,
+    UPSCALER: _warm_upscaler,
+}
+
+
+def warm_up_model(kind: str, model_name: str):
+    """Loads a model and runs a tiny inference so kernels are set up before the first user."""
+    key = ModelManager._key(model_name, kind)
+    _state[key] = {"status": "loading"}
+    start = time.time()
+    try:
+        with ModelManager.use(kind, model_name) as instance:
+            WARMUPS[kind](instance)
+        _state[key] = {"status": "warm", "seconds": round(time.time() - start, 2)}
+        logger.info(f"Warmed up {key} in {time.time() - start:.1f}s")
+    except Exception as e:
+        logger.exception(f"Warm-up of {key} failed")
+        _state[key] = {"status": "failed", "seconds": round(time.time() - start, 2), "error": str(e)}
+
+
+def start_preload():
+    """Queues every preload model on the preload lane in priority order."""
+    for kind, model_name in ModelManager.preload_plan():
+        key = ModelManager._key(model_name, kind)
+        _state[key] = {"status": "pending"}
+        try:
+            submit_preload(warm_up_model, kind, model_name)
+        except Exception as e:
+            logger.warning(f"Could not queue warm-up of {key}: {e}")
+            _state[key] = {"status": "failed", "error": str(e)}
+
+
+def readiness() -> Dict[str, Any]:
+    ready = all(state["status"] in ("warm", "failed") for state in _state.values())
+    return {"ready": ready, "models": dict(_state)}
@@ -2,51 +2,133 @@ import os
 import requests
 import threading
 import time
+from stable_diffusion.latent_preview import latents_to_thumbnails, encode_thumbnail
+from services.cancellation import is_cancelled
 
 BACKEND_HOST = os.getenv("BACKEND_HOST", "localhost")
 BACKEND_PORT = os.getenv("BACKEND_PORT", "8000")
 
 DJANGO_API_URL = f"http://{BACKEND_HOST}:{BACKEND_PORT}"
 
+# How often the sender flushes coalesced updates to the backend
+PROGRESS_FLUSH_INTERVAL = float(os.getenv("PROGRESS_FLUSH_INTERVAL", "0.25"))
+# Live latent previews: every N denoising steps (0 disables them), at most once per interval
+LATENT_PREVIEW_EVERY = int(os.getenv("LATENT_PREVIEW_EVERY", "0"))
+LATENT_PREVIEW_MIN_INTERVAL = float(os.getenv("LATENT_PREVIEW_MIN_INTERVAL", "1.0"))
+
 session = requests.Session()
 
-_last_sent = {}  
 
-def send_progress_async(job_id: int, progress: float, event: str):
-    """Sends progress in separate thread."""
-    def _send():
+class ProgressSender:
+    """
+    One long-lived sender thread per process.
+    Only the latest update of each job is kept until the next flush, all
+    pending jobs are then posted together to the batch progress endpoint.
+    """
+
+    def __init__(self, interval: float = PROGRESS_FLUSH_INTERVAL):
+        self.interval = interval
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="progress-sender", daemon=True)
+                self._thread.start()
+
+    def update(self, job_id: int, progress: float, event: str = "step-end", **extra):
+        """Queues an update, replacing any update of the same job not sent yet."""
+        self._ensure_started()
+        extra = {name: value for name, value in extra.items() if value is not None}
+        with self._lock:
+            previous = self._pending.get(job_id)
+            if previous and "preview" in previous and "preview" not in extra:
+                # keep an unsent thumbnail when a plain progress tick replaces its update
+                extra["preview"] = previous["preview"]
+            self._pending[job_id] = {"job_id": job_id, "progress": progress, "event": event, **extra}
+        if progress >= 1:
+            self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            with self._lock:
+                updates, self._pending = list(self._pending.values()), {}
+            if updates:
+                self._send(updates)
+
+    def _send(self, updates):
+        for update in updates:
+            # thumbnails are encoded here, off the denoising thread, and only if still the latest
+            if update.get("preview") is not None:
+                update["preview"] = encode_thumbnail(update["preview"])
         try:
             session.post(
-                f"{DJANGO_API_URL}/api/job-progress/",
-                json={
-                    "job_id": job_id,
-                    "progress": progress,
-                    "event": event,
-                },
-                timeout=1,
+                f"{DJANGO_API_URL}/api/job-progress/batch/",
+                json={"updates": updates},
+                timeout=2,
             )
         except Exception as e:
-            print(f"[WARN] Failed to notify Django about progress {progress}: {e}")
-    threading.Thread(target=_send, daemon=True).start()
+            print(f"[WARN] Failed to notify Django about progress of {len(updates)} job(s): {e}")
+
+
+progress_sender = ProgressSender()
+
 
-def callback(num_steps: int, job_id: int, min_interval: float = 0.3):
+def callback(
+    num_steps: int,
+    job_id: int,
+    min_interval: float = 0.3,
+    preview_every: int = LATENT_PREVIEW_EVERY,
+    preview_interval: float = LATENT_PREVIEW_MIN_INTERVAL,
+):
     """
     Returns a callback that throttles progress updates.
     :param num_steps: Total number of steps.
-    :param job_id: Job identifier.
+    :param job_id: Job identifier, or a list of them for a batched pipeline call.
     :param min_interval: Minimum time (in seconds) between progress updates.
+    :param preview_every: Attach a latent thumbnail every N steps, 0 disables previews.
+    :param preview_interval: Minimum time (in seconds) between thumbnails.
     """
+    job_ids = list(job_id) if isinstance(job_id, (list, tuple)) else [job_id]
+    # warm-up runs have no job to report to
+    job_ids = [item_job_id for item_job_id in job_ids if item_job_id is not None]
+    # throttle state lives as long as this pipeline call
+    last_sent = 0.0
+    last_preview = 0.0
+
     def on_step_end(pipe, step_index: int, timestep, callback_kwargs):
+        nonlocal last_sent, last_preview
+        # stop denoising after this step once every job of the call was cancelled
+        if job_ids and all(is_cancelled(item_job_id) for item_job_id in job_ids):
+            pipe._interrupt = True
+            return callback_kwargs
+
         current_step = step_index + 1
         progress = (current_step / num_steps)
 
         now = time.time()
-        last_sent = _last_sent.get(job_id, 0)
-
         if now - last_sent >= min_interval or current_step == num_steps:
-            _last_sent[job_id] = now
-            send_progress_async(job_id, progress, "step-end")
+            last_sent = now
+            thumbnails = [None] * len(job_ids)
+            latents = callback_kwargs.get("latents")
+            if (
+                job_ids
+                and preview_every > 0
+                and latents is not None
+                and current_step % preview_every == 0
+                and current_step < num_steps
+                and now - last_preview >= preview_interval
+            ):
+                last_preview = now
+                thumbnails = latents_to_thumbnails(pipe, latents[:len(job_ids)])
+            for item_job_id, thumbnail in zip(job_ids, thumbnails):
+                progress_sender.update(item_job_id, progress, "step-end", preview=thumbnail)
 
         return callback_kwargs
 
-    return on_step_end
\ No newline at end of file
+    return on_step_end
@@ -0,0 +1,163 @@
+import os
+import json
+import shutil
+import hashlib
+import logging
+from typing import Optional
+import torch
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Where converted pipelines are stored, by default a .converted folder next to each checkpoint
+CHECKPOINT_CACHE_DIR = os.getenv("CHECKPOINT_CACHE_DIR")
+MANIFEST_NAME = "prep_manifest.json"
+HASHES_NAME = "hashes.json"
+CACHE_FORMAT_VERSION = 2
+
+
+def _cache_root(model_path: str) -> str:
+    if CHECKPOINT_CACHE_DIR:
+        return CHECKPOINT_CACHE_DIR
+    return os.path.join(os.path.dirname(os.path.abspath(model_path)), ".converted")
+
+
+def is_single_file(model_path: str) -> bool:
+    return os.path.isfile(model_path) and model_path.endswith((".safetensors", ".ckpt"))
+
+
+def file_hash(model_path: str) -> str:
+    """
+    sha256 of a checkpoint. Hashes are remembered per (size, mtime) in the
+    cache root so multi-GB files are only read once.
+    """
+    stat = os.stat(model_path)
+    path = os.path.abspath(model_path)
+    hashes_path = os.path.join(_cache_root(model_path), HASHES_NAME)
+    hashes = {}
+    if os.path.exists(hashes_path):
+        try:
+            with open(hashes_path, "r") as f:
+                hashes = json.load(f)
+        except (OSError, ValueError):
+            hashes = {}
+
+    known = hashes.get(path)
+    if known and known["size"] == stat.st_size and known["mtime"] == stat.st_mtime_ns:
+        return known["sha256"]
+
+    digest = hashlib.sha256()
+    with open(model_path, "rb") as f:
+        for chunk in iter(lambda: f.read(16 * 1024 * 1024), b""):
+            digest.update(chunk)
+
+    hashes[path] = {"size": stat.st_size, "mtime": stat.st_mtime_ns, "sha256": digest.hexdigest()}
+    try:
+        os.makedirs(os.path.dirname(hashes_path), exist_ok=True)
+        with open(hashes_path, "w") as f:
+            json.dump(hashes, f, indent=2)
+    except OSError as e:
+        logger.warning(f"Could not store checkpoint hash: {e}")
+    return hashes[path]["sha256"]
+
+
+def _options(pipeline_cls, torch_dtype: torch.dtype) -> dict:
+    return {
+        "pipeline": pipeline_cls.__name__,
+        "dtype": str(torch_dtype),
+        "version": CACHE_FORMAT_VERSION,
+    }
+
+
+def _fingerprint(model_path: str) -> dict:
+    """Cheap identity of a checkpoint file, no need to read it."""
+    stat = os.stat(model_path)
+    return {"source": os.path.abspath(model_path), "size": stat.st_size, "mtime": stat.st_mtime_ns}
+
+
+def cache_dir(pipeline_cls, model_path: str, torch_dtype: torch.dtype) -> str:
+    """
+    Cache folder keyed by the checkpoint's path, size and mtime and the
+    conversion options. The full sha256 is only recorded in the manifest.
+    """
+    options = _options(pipeline_cls, torch_dtype)
+    key = hashlib.sha256(
+        json.dumps({**_fingerprint(model_path), **options}, sort_keys=True).encode()
+    ).hexdigest()[:24]
+    name = os.path.splitext(os.path.basename(model_path))[0]
+    return os.path.join(_cache_root(model_path), f"{name}-{pipeline_cls.__name__}-{key}")
+
+
+def _valid(path: str, fingerprint: dict = None) -> bool:
+    manifest_path = os.path.join(path, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return False
+    try:
+        with open(manifest_path, "r") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return False
+    if not manifest.get("complete", False):
+        return False
+    return fingerprint is None or all(manifest.get(k) == v for k, v in fingerprint.items())
+
+
+def cached_path(pipeline_cls, model_path: str, torch_dtype: torch.dtype) -> Optional[str]:
+    """Returns the converted folder for a checkpoint if a valid one exists, without hashing it."""
+    if not is_single_file(model_path):
+        return None
+    if not os.path.isdir(_cache_root(model_path)):
+        return None
+    path = cache_dir(pipeline_cls, model_path, torch_dtype)
+    return path if _valid(path, _fingerprint(model_path)) else None
+
+
+def load_pipeline(pipeline_cls, model_path: str, torch_dtype: torch.dtype = torch.float16, **kwargs):
+    """
+    Loads a pipeline from its converted cache when available, from the
+    original single-file checkpoint otherwise. kwargs are passed to either loader.
+    """
+    path = cached_path(pipeline_cls, model_path, torch_dtype)
+    if path:
+        logger.info(f"Loading {pipeline_cls.__name__} from converted cache {path}")
+        return pipeline_cls.from_pretrained(path, torch_dtype=torch_dtype, **kwargs)
+    return pipeline_cls.from_single_file(model_path, torch_dtype=torch_dtype, **kwargs)
+
+
+def convert_checkpoint(pipeline_cls, model_path: str, torch_dtype: torch.dtype = torch.float16, force: bool = False) -> str:
+    """
+    Converts a single-file checkpoint once into a diffusers folder with one
+    safetensors file per component, already cast to torch_dtype.
+    """
+    target = cache_dir(pipeline_cls, model_path, torch_dtype)
+    fingerprint = _fingerprint(model_path)
+    if _valid(target, fingerprint) and not force:
+        logger.info(f"{model_path} already converted at {target}")
+        return target
+
+    root = _cache_root(model_path)
+    os.makedirs(root, exist_ok=True)
+    if not os.access(root, os.W_OK):
+        # nothing could be stored, so do not pay for hashing the checkpoint either
+        raise PermissionError(f"Checkpoint cache {root} is not writable")
+
+    tmp = target + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    pipeline = pipeline_cls.from_single_file(model_path, torch_dtype=torch_dtype)
+    pipeline.save_pretrained(tmp, safe_serialization=True)
+
+    manifest = {
+        "complete": True,
+        **fingerprint,
+        "sha256": file_hash(model_path),
+        **_options(pipeline_cls, torch_dtype),
+    }
+    with open(os.path.join(tmp, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(tmp, target)
+    logger.info(f"Converted {model_path} to {target}")
+    return target
@@ -14,6 +14,8 @@ from diffusers import (
 from fastapi import HTTPException
 import logging
 from stable_diffusion.callback import callback 
+from stable_diffusion.pipeline_utils import request_pipeline
+from stable_diffusion.prompt_cache import PromptEmbeddingCache
 
 logger = logging.getLogger(__name__)
 
@@ -24,11 +26,15 @@ class ControlNet:
     It uses stable diffusion 1.5 model, controlnets (in this case canny)
     """
 
+    # resolution the checkpoint was trained at, cropped regions are resized to it
+    NATIVE_RESOLUTION = 512
+
     def __init__(self, use_controlnet: bool = True, device: Optional[str] = None):
         self.use_controlnet = use_controlnet
         self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
         self.pipeline = None
         self._controlnet_loaded = False
+        self.prompt_cache = PromptEmbeddingCache()
 
     # ------------- loading/unloading -------------
 
@@ -98,6 +104,7 @@ class ControlNet:
             if self.pipeline is not None:
                 del self.pipeline
                 self.pipeline = None
+            self.prompt_cache.clear()
             if self.device == "cuda":
                 torch.cuda.empty_cache()
         except Exception:
@@ -137,6 +144,13 @@ class ControlNet:
 
     # ------------- inference -------------
 
+    def encode_prompts(self, prompts, negative_prompts, guidance_scale: float = 7.5):
+        """Encodes several prompts in one text-encoder call and keeps them in the prompt cache."""
+        if self.pipeline is None:
+            raise HTTPException(status_code=500, detail="Pipeline not loaded")
+        return self.prompt_cache.encode(self.pipeline, prompts, negative_prompts, guidance_scale)
+
+
     def generate_image(
         self,
         *,
@@ -189,11 +203,11 @@ class ControlNet:
             generator = torch.Generator(device=self.device).manual_seed(seed)
 
         try:
-            self.pipeline.scheduler.set_timesteps(steps)
-            _, actual_steps = self.pipeline.get_timesteps(steps, strength, self.device)
+            pipe = request_pipeline(self.pipeline)
+            pipe.scheduler.set_timesteps(steps)
+            _, actual_steps = pipe.get_timesteps(steps, strength, self.device)
             kwargs = dict(
-                prompt=prompt,
-                negative_prompt=negative_prompt,
+                **self.prompt_cache.encode(self.pipeline, [prompt], [negative_prompt], guidance_scale),
                 image=init_image,
                 mask_image=mask_l,
                 num_inference_steps=steps,
@@ -211,7 +225,7 @@ class ControlNet:
                     )
                 )
 
-            result = self.pipeline(**kwargs)
+            result = pipe(**kwargs)
             gen = result.images[0]
 
             if keep_background:
@@ -0,0 +1,44 @@
+import io
+import base64
+import numpy as np
+import torch
+from PIL import Image
+
+# Linear latent -> RGB approximations, much cheaper than a VAE decode
+SD15_LATENT_RGB = [
+    [0.3512, 0.2297, 0.3227],
+    [0.3250, 0.4974, 0.2350],
+    [-0.2829, 0.1762, 0.2721],
+    [-0.2120, -0.2616, -0.7177],
+]
+SDXL_LATENT_RGB = [
+    [0.3651, 0.4232, 0.4341],
+    [-0.2533, -0.0042, 0.1068],
+    [0.1076, 0.1111, -0.0362],
+    [-0.3165, -0.2492, -0.2188],
+]
+SDXL_LATENT_RGB_BIAS = [0.1084, -0.0175, -0.0011]
+
+
+def latents_to_thumbnails(pipe, latents: torch.Tensor) -> list:
+    """
+    Projects every item of a latent batch to a small uint8 RGB array at the
+    latent resolution (1/8 of the output). Runs on the latents' device, only
+    the tiny result is copied to the host.
+    """
+    sdxl = getattr(pipe, "text_encoder_2", None) is not None
+    factors = torch.tensor(
+        SDXL_LATENT_RGB if sdxl else SD15_LATENT_RGB, device=latents.device, dtype=torch.float32
+    )
+    rgb = torch.einsum("bchw,cr->bhwr", latents[:, :4].float(), factors)
+    if sdxl:
+        rgb = rgb + torch.tensor(SDXL_LATENT_RGB_BIAS, device=latents.device)
+    rgb = ((rgb + 1) * 127.5).clamp(0, 255).to(torch.uint8)
+    return list(rgb.cpu().numpy())
+
+
+def encode_thumbnail(pixels: np.ndarray, quality: int = 60) -> str:
+    """Encodes an RGB array as a WebP data URL for the progress channel."""
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="WEBP", quality=quality)
+    return "data:image/webp;base64," + base64.b64encode(buffer.getvalue()).decode("ascii")
@@ -0,0 +1,72 @@
+import torch
+import torch.nn.functional as F
+import numpy as np
+from PIL import Image
+
+
+def _vae_needs_upcast(pipe) -> bool:
+    # SDXL VAEs overflow in fp16, the pipelines upcast them the same way
+    return pipe.vae.dtype == torch.float16 and getattr(pipe.vae.config, "force_upcast", False)
+
+
+def _encode_pixels(pipe, pixels: torch.Tensor) -> torch.Tensor:
+    upcast = _vae_needs_upcast(pipe)
+    dtype = torch.float32 if upcast else pipe.vae.dtype
+    if upcast:
+        pipe.vae.to(torch.float32)
+    try:
+        latents = pipe.vae.encode(pixels.to(pipe.device, dtype=dtype)).latent_dist.mode()
+    finally:
+        if upcast:
+            pipe.vae.to(torch.float16)
+    return latents * pipe.vae.config.scaling_factor
+
+
+@torch.no_grad()
+def encode_image(pipe, image: Image.Image) -> torch.Tensor:
+    """VAE-encodes a PIL image into scaled latents on the pipeline device."""
+    return _encode_pixels(pipe, pipe.image_processor.preprocess(image))
+
+
+@torch.no_grad()
+def encode_masked_image(pipe, image: Image.Image, mask: Image.Image) -> torch.Tensor:
+    """
+    masked_image_latents as 9-channel inpaint UNets expect them: the VAE
+    encoding of the image with the repaint area (white in mask) blanked,
+    the same way the inpaint pipelines build it from pixels.
+    """
+    pixels = pipe.image_processor.preprocess(image)
+    keep = torch.from_numpy(np.array(mask.convert("L"), dtype=np.float32) / 255.0) < 0.5
+    return _encode_pixels(pipe, pixels * keep[None, None])
+
+
+@torch.no_grad()
+def decode_latents(pipe, latents: torch.Tensor) -> Image.Image:
+    """Decodes scaled latents into a PIL image."""
+    upcast = _vae_needs_upcast(pipe)
+    dtype = torch.float32 if upcast else pipe.vae.dtype
+    if upcast:
+        pipe.vae.to(torch.float32)
+    try:
+        pixels = pipe.vae.decode(latents.to(dtype) / pipe.vae.config.scaling_factor).sample
+    finally:
+        if upcast:
+            pipe.vae.to(torch.float16)
+    return pipe.image_processor.postprocess(pixels, output_type="pil")[0]
+
+
+def latent_mask(mask: Image.Image, latents: torch.Tensor) -> torch.Tensor:
+    """
+    Downscales a repaint mask (white = repaint) to the latent resolution.
+    Soft edges of a feathered mask are kept as fractional weights.
+    """
+    weights = torch.from_numpy(np.array(mask.convert("L"), dtype=np.float32) / 255.0)
+    weights = weights[None, None].to(latents.device)
+    weights = F.interpolate(weights, size=latents.shape[-2:], mode="area")
+    return weights.to(latents.dtype)
+
+
+def blend_latents(generated: torch.Tensor, original: torch.Tensor, mask: torch.Tensor) -> torch.Tensor:
+    """Latent-space equivalent of compositing the generated image over the original."""
+    generated = generated.to(original.dtype)
+    return generated * mask + original * (1 - mask)
@@ -0,0 +1,38 @@
+import copy
+from typing import Any, Dict
+
+# Components that mean the same thing in the inpaint and text-to-image
+# pipelines of one checkpoint, whatever the UNet layout is.
+SHARED_COMPONENTS = ("vae", "text_encoder", "text_encoder_2", "tokenizer", "tokenizer_2")
+
+
+def shared_components(pipeline) -> Dict[str, Any]:
+    """Returns the loaded components of pipeline that another pipeline kind can reuse."""
+    if pipeline is None:
+        return {}
+    components = pipeline.components
+    return {
+        name: components[name]
+        for name in SHARED_COMPONENTS
+        if components.get(name) is not None
+    }
+
+
+def can_share_unet(pipeline) -> bool:
+    """
+    A text-to-image pipeline can only reuse a plain 4-channel UNet,
+    dedicated inpainting checkpoints have 9 input channels.
+    """
+    unet = getattr(pipeline, "unet", None)
+    return unet is not None and unet.config.in_channels == 4
+
+
+def request_pipeline(pipeline):
+    """
+    Returns a shallow copy of pipeline with its own scheduler instance.
+    Modules are shared, but set_timesteps and the per-call step state of one
+    request can no longer leak into another request on the same pipeline.
+    """
+    pipe = copy.copy(pipeline)
+    pipe.scheduler = pipeline.scheduler.__class__.from_config(pipeline.scheduler.config)
+    return pipe
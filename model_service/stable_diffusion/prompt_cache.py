@@ -0,0 +1,132 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+import torch
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Number of (prompt, negative prompt) pairs kept per model
+PROMPT_CACHE_SIZE = int(os.getenv("PROMPT_CACHE_SIZE", "64"))
+
+
+class PromptEmbeddingCache:
+    """
+    Bounded LRU cache of text-encoder outputs for one model.
+    Each entry holds the embeddings of a single (prompt, negative prompt) pair,
+    kept on the host so an evicted or staged model does not leave them in VRAM.
+    Misses of one request are encoded together in a single encoder call.
+    """
+
+    def __init__(self, max_entries: int = PROMPT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, Dict[str, torch.Tensor]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _is_sdxl(pipe) -> bool:
+        return getattr(pipe, "text_encoder_2", None) is not None
+
+    @staticmethod
+    def _model_key(pipe) -> tuple:
+        tokenizer = pipe.tokenizer if pipe.tokenizer is not None else getattr(pipe, "tokenizer_2", None)
+        return (
+            pipe.config.get("_name_or_path", ""),
+            type(tokenizer).__name__,
+            getattr(tokenizer, "name_or_path", ""),
+            len(tokenizer) if tokenizer is not None else 0,
+        )
+
+    def _encode(self, pipe, prompts: List[str], negative_prompts: List[str], do_cfg: bool, clip_skip: Optional[int]):
+        """One batched encoder call, returns embeddings split into single rows."""
+        device = pipe.device
+        with torch.no_grad():
+            if self._is_sdxl(pipe):
+                embeds, negative, pooled, negative_pooled = pipe.encode_prompt(
+                    prompt=prompts,
+                    device=device,
+                    num_images_per_prompt=1,
+                    do_classifier_free_guidance=do_cfg,
+                    negative_prompt=negative_prompts,
+                    clip_skip=clip_skip,
+                )
+                outputs = {
+                    "prompt_embeds": embeds,
+                    "negative_prompt_embeds": negative,
+                    "pooled_prompt_embeds": pooled,
+                    "negative_pooled_prompt_embeds": negative_pooled,
+                }
+            else:
+                embeds, negative = pipe.encode_prompt(
+                    prompts,
+                    device,
+                    1,
+                    do_cfg,
+                    negative_prompt=negative_prompts,
+                    clip_skip=clip_skip,
+                )
+                outputs = {"prompt_embeds": embeds, "negative_prompt_embeds": negative}
+
+        return [
+            {name: tensor[i:i + 1].cpu() for name, tensor in outputs.items() if tensor is not None}
+            for i in range(len(prompts))
+        ]
+
+    def encode(
+        self,
+        pipe,
+        prompts: List[str],
+        negative_prompts: List[str],
+        guidance_scale: float = 7.5,
+        clip_skip: Optional[int] = None,
+    ) -> Dict[str, torch.Tensor]:
+        """
+        Returns pipeline kwargs (prompt_embeds, negative_prompt_embeds and the
+        pooled SDXL variants) for the given prompts, encoding only the misses.
+        """
+        do_cfg = guidance_scale > 1
+        model_key = self._model_key(pipe)
+        keys = [
+            (model_key, prompt, negative if do_cfg else None, do_cfg, clip_skip)
+            for prompt, negative in zip(prompts, negative_prompts)
+        ]
+
+        rows = {}
+        with self._lock:
+            for key in keys:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    rows[key] = self._entries[key]
+                    self.hits += 1
+
+        missing = list(OrderedDict.fromkeys(key for key in keys if key not in rows))
+        if missing:
+            encoded = self._encode(
+                pipe,
+                [key[1] for key in missing],
+                [key[2] or "" for key in missing],
+                do_cfg,
+                clip_skip,
+            )
+            with self._lock:
+                for key, row in zip(missing, encoded):
+                    rows[key] = row
+                    self._entries[key] = row
+                    self.misses += 1
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+
+        return {
+            name: torch.cat([rows[key][name] for key in keys]).to(pipe.device)
+            for name in rows[keys[0]]
+        }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
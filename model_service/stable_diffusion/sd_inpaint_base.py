@@ -9,6 +9,10 @@ from torchvision import transforms
 from fastapi import HTTPException
 import logging
 from stable_diffusion.callback import callback 
+from stable_diffusion.pipeline_utils import request_pipeline
+from stable_diffusion.checkpoint_cache import load_pipeline
+from stable_diffusion.prompt_cache import PromptEmbeddingCache
+from stable_diffusion.latents import encode_image, encode_masked_image, decode_latents, latent_mask, blend_latents
 
 logger = logging.getLogger(__name__)
 
@@ -19,10 +23,16 @@ class UnifiedInpaintModel:
     Różnice między modelami kontrolowane są parametrami load_model() i generate_image().
     """
 
+    # diffusers pipeline built from the checkpoint, used by prepare_models.py
+    PIPELINE_CLASS = StableDiffusionInpaintPipeline
+    # resolution the checkpoint was trained at, cropped regions are resized to it
+    NATIVE_RESOLUTION = 512
+
     def __init__(self, device: Optional[str] = None):
         self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
         self.pipeline = None
         self.upscaler = None
+        self.prompt_cache = PromptEmbeddingCache()
 
     # ---------------- helpers ----------------
 
@@ -89,20 +99,30 @@ class UnifiedInpaintModel:
         torch_dtype: torch.dtype = torch.float16,
         vae_path: Optional[str] = None,
         upscaler_path: Optional[str] = None,
+        shared_pipeline=None,
     ):
         """
         Ładowanie modelu z .safetensors lub folderu diffusers.
         - vae_path: opcjonalny VAE (np. dla RealisticVision)
         - upscaler_path: opcjonalny upscaler (np. dla CyberRealistic)
+        - shared_pipeline: loaded text-to-image pipeline of the same checkpoint,
+          its UNet, VAE and text encoders are reused instead of loading a copy
         """
         try:
-            self.pipeline = StableDiffusionInpaintPipeline.from_single_file(
-                model_path,
-                torch_dtype=torch_dtype,
-                feature_extractor=None,
-            )
+            if shared_pipeline is not None:
+                self.pipeline = StableDiffusionInpaintPipeline.from_pipe(
+                    shared_pipeline,
+                    feature_extractor=None,
+                )
+            else:
+                self.pipeline = load_pipeline(
+                    StableDiffusionInpaintPipeline,
+                    model_path,
+                    torch_dtype=torch_dtype,
+                    feature_extractor=None,
+                )
 
-            if vae_path:
+            if vae_path and shared_pipeline is None:
                 logger.info(f"Loading VAE from {vae_path}")
                 self.pipeline.vae = AutoencoderKL.from_pretrained(
                     vae_path, torch_dtype=torch_dtype
@@ -114,7 +134,9 @@ class UnifiedInpaintModel:
             scheduler.use_karras_sigmas = True
             self.pipeline.scheduler = scheduler
 
-            self._enable_speed_optimizations(self.pipeline)
+            # shared modules were already optimized by the pipeline that owns them
+            if shared_pipeline is None:
+                self._enable_speed_optimizations(self.pipeline)
             self.pipeline.to(self.device)
 
             if upscaler_path and os.path.isfile(upscaler_path):
@@ -129,6 +151,7 @@ class UnifiedInpaintModel:
         try:
             self.pipeline = None
             self.upscaler = None
+            self.prompt_cache.clear()
             if self.device == "cuda":
                 torch.cuda.empty_cache()
         except Exception:
@@ -136,6 +159,13 @@ class UnifiedInpaintModel:
 
     # ---------------- inference ----------------
 
+    def encode_prompts(self, prompts, negative_prompts, guidance_scale: float = 7.5):
+        """Encodes several prompts in one text-encoder call and keeps them in the prompt cache."""
+        if self.pipeline is None:
+            raise HTTPException(status_code=500, detail="Pipeline not loaded")
+        return self.prompt_cache.encode(self.pipeline, prompts, negative_prompts, guidance_scale)
+
+
     def generate_image(
         self,
         *,
@@ -186,11 +216,14 @@ class UnifiedInpaintModel:
             generator = torch.Generator(device=self.device).manual_seed(seed)
 
         try:
-            self.pipeline.scheduler.set_timesteps(steps)
-            _, actual_steps = self.pipeline.get_timesteps(steps, strength, self.device)
-            result = self.pipeline(
-                prompt=prompt,
-                negative_prompt=negative_prompt,
+            pipe = request_pipeline(self.pipeline)
+            pipe.scheduler.set_timesteps(steps)
+            _, actual_steps = pipe.get_timesteps(steps, strength, self.device)
+            prompt_embeds = self.prompt_cache.encode(
+                self.pipeline, [prompt], [negative_prompt], guidance_scale
+            )
+            result = pipe(
+                **prompt_embeds,
                 image=init,
                 mask_image=mask,
                 num_inference_steps=steps,
@@ -225,3 +258,89 @@ class UnifiedInpaintModel:
         except Exception as e:
             logger.exception("Generation error")
             raise HTTPException(status_code=500, detail=f"Generation error: {e}")
+
+    # ---------------- latent passes ----------------
+
+    def encode_image(self, image: Image.Image) -> torch.Tensor:
+        """VAE-encodes the working image once so following passes can stay in latent space."""
+        if self.pipeline is None:
+            raise HTTPException(status_code=500, detail="Pipeline not loaded")
+        image = self._ensure_rgb(image)
+        image = image.resize(self._to_multiple_of_8(image.size), Image.LANCZOS)
+        return encode_image(self.pipeline, image)
+
+    def decode_latents(self, latents: torch.Tensor) -> Image.Image:
+        if self.pipeline is None:
+            raise HTTPException(status_code=500, detail="Pipeline not loaded")
+        return decode_latents(self.pipeline, latents)
+
+    def generate_latents(
+        self,
+        *,
+        job_id,
+        prompt: str,
+        init_latents: torch.Tensor,
+        mask_image: Image.Image,
+        init_image: Optional[Image.Image] = None,
+        negative_prompt: str = "",
+        steps: int = 30,
+        guidance_scale: float = 7.5,
+        strength: float = 0.75,
+        seed: Optional[int] = None,
+        invert_mask: bool = True,
+    ) -> torch.Tensor:
+        """
+        Same pass as generate_image, but starts from and returns latents.
+        The background is kept by blending with init_latents under the
+        latent-resolution mask instead of compositing decoded pixels.
+        init_image is the picture init_latents were encoded from, used for the
+        masked-image conditioning (decoded from init_latents when omitted).
+        """
+        if self.pipeline is None:
+            raise HTTPException(status_code=500, detail="Pipeline not loaded")
+
+        scale = self.pipeline.vae_scale_factor
+        height, width = init_latents.shape[-2] * scale, init_latents.shape[-1] * scale
+        mask = self._ensure_l(mask_image).resize((width, height), Image.NEAREST)
+        if invert_mask:
+            mask = self._invert_mask(mask)
+        repaint = latent_mask(mask, init_latents)
+
+        if init_image is None:
+            init_image = decode_latents(self.pipeline, init_latents)
+        init_image = self._ensure_rgb(init_image).resize((width, height), Image.LANCZOS)
+
+        generator = None
+        if seed is not None:
+            generator = torch.Generator(device=self.device).manual_seed(seed)
+
+        try:
+            pipe = request_pipeline(self.pipeline)
+            pipe.scheduler.set_timesteps(steps)
+            _, actual_steps = pipe.get_timesteps(steps, strength, self.device)
+            prompt_embeds = self.prompt_cache.encode(
+                self.pipeline, [prompt], [negative_prompt], guidance_scale
+            )
+            result = pipe(
+                **prompt_embeds,
+                image=init_latents,
+                mask_image=mask,
+                masked_image_latents=encode_masked_image(self.pipeline, init_image, mask),
+                height=height,
+                width=width,
+                num_inference_steps=steps,
+                guidance_scale=guidance_scale,
+                strength=strength,
+                generator=generator,
+                output_type="latent",
+                callback_on_step_end=callback(job_id=job_id, num_steps=actual_steps),
+            )
+            return blend_latents(result.images, init_latents, repaint)
+
+        except torch.cuda.OutOfMemoryError:
+            if self.device == "cuda":
+                torch.cuda.empty_cache()
+            raise HTTPException(status_code=500, detail="VRAM out of memory")
+        except Exception as e:
+            logger.exception("Generation error")
+            raise HTTPException(status_code=500, detail=f"Generation error: {e}")
@@ -1,7 +1,7 @@
 import os
 os.environ.setdefault("PYTORCH_CUDA_ALLOC_CONF", "expandable_segments:True")
 
-from typing import Optional
+from typing import List, Optional
 import torch
 from PIL import Image
 from diffusers import (
@@ -13,6 +13,9 @@ from torchvision import transforms
 from fastapi import HTTPException
 import logging
 from stable_diffusion.callback import callback
+from stable_diffusion.pipeline_utils import shared_components, can_share_unet, request_pipeline
+from stable_diffusion.checkpoint_cache import load_pipeline
+from stable_diffusion.prompt_cache import PromptEmbeddingCache
 
 logger = logging.getLogger(__name__)
 
@@ -24,11 +27,15 @@ class SDTextToImageModel:
     Supports VAE, upscaler, and VRAM optimizations.
     """
 
+    # diffusers pipeline built from the checkpoint, used by prepare_models.py
+    PIPELINE_CLASS = StableDiffusionPipeline
+
     def __init__(self, device: Optional[str] = None, upscaler_path: Optional[str] = None):
         self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
         self.pipeline = None
         self.upscaler = None
         self.upscaler_path = upscaler_path
+        self.prompt_cache = PromptEmbeddingCache()
 
     # ---------------- Speed & VRAM Optimizations ----------------
     def _enable_speed_optimizations(self, pipe):
@@ -60,19 +67,26 @@ class SDTextToImageModel:
         model_path: str,
         torch_dtype: torch.dtype = torch.float16,
         vae_path: Optional[str] = None,
+        shared_pipeline=None,
     ):
         try:
             logger.info(f"Loading SDXL model from {model_path}")
 
-            # Load base pipeline from .safetensors
-            self.pipeline = StableDiffusionPipeline.from_single_file(
-                model_path,
-                torch_dtype=torch_dtype,
-                use_safetensors=True,
-            )
+            if shared_pipeline is not None and can_share_unet(shared_pipeline):
+                # Same checkpoint already loaded as inpaint pipeline, reuse all its weights
+                self.pipeline = StableDiffusionPipeline.from_pipe(shared_pipeline)
+            else:
+                # Load base pipeline from .safetensors, borrowing VAE and text encoders if possible
+                self.pipeline = load_pipeline(
+                    StableDiffusionPipeline,
+                    model_path,
+                    torch_dtype=torch_dtype,
+                    use_safetensors=True,
+                    **shared_components(shared_pipeline),
+                )
 
             # Optional: load custom VAE
-            if vae_path:
+            if vae_path and shared_pipeline is None:
                 try:
                     vae = AutoencoderKL.from_pretrained(vae_path, torch_dtype=torch_dtype)
                     self.pipeline.vae = vae
@@ -87,7 +101,9 @@ class SDTextToImageModel:
 
             # Move to device
             self.pipeline.to(self.device)
-            self._enable_speed_optimizations(self.pipeline)
+            # Shared modules were already optimized by the pipeline that owns them
+            if shared_pipeline is None:
+                self._enable_speed_optimizations(self.pipeline)
 
             # Load upscaler (e.g. 4x_NMKD-Superscale-SP_178000_G.pth)
             if self.upscaler_path and os.path.isfile(self.upscaler_path):
@@ -107,6 +123,7 @@ class SDTextToImageModel:
         if self.pipeline is not None:
             self.pipeline = None
         self.upscaler = None
+        self.prompt_cache.clear()
         if torch.cuda.is_available():
             torch.cuda.empty_cache()
             torch.cuda.synchronize()
@@ -146,6 +163,63 @@ class SDTextToImageModel:
         Returns:
             Generated PIL Image
         """
+        image = self.generate_images(
+            job_ids=[job_id],
+            prompts=[prompt],
+            negative_prompts=[negative_prompt],
+            seeds=[seed],
+            width=width,
+            height=height,
+            steps=steps,
+            guidance_scale=guidance_scale,
+        )[0]
+
+        try:
+            # Optional: upscale
+            if apply_upscale and self.upscaler is not None:
+                import numpy as np
+                import cv2
+
+                # Convert PIL to tensor
+                img_np = np.array(image).astype(np.float32) / 255.0
+                img_tensor = torch.from_numpy(img_np).permute(2, 0, 1).unsqueeze(0).to(self.device)
+
+                # Upscale
+                with torch.no_grad():
+                    upsampled = self.upscaler(img_tensor * 2 - 1)  # [-1, 1] range
+                    upsampled = (upsampled[0].permute(1, 2, 0).cpu().numpy() + 1) / 2
+                    upsampled = (upsampled * 255).clip(0, 255).astype(np.uint8)
+
+                image = Image.fromarray(upsampled)
+                logger.info("Applied 2x upscaling")
+
+            return image
+
+        except torch.cuda.OutOfMemoryError:
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+            raise HTTPException(status_code=500, detail="VRAM out of memory")
+        except Exception as e:
+            logger.exception("Upscaling error")
+            raise HTTPException(status_code=500, detail=f"Generation error: {e}")
+
+    def generate_images(
+        self,
+        *,
+        job_ids: List[int],
+        prompts: List[str],
+        negative_prompts: List[str],
+        seeds: List[Optional[int]],
+        width: int = 768,
+        height: int = 1024,
+        steps: int = 28,
+        guidance_scale: float = 5.0,
+    ) -> List[Image.Image]:
+        """
+        Generate a batch of images in one pipeline call.
+        All items share resolution, steps and guidance, each one keeps its own
+        prompt, negative prompt and seed. Progress is reported for every job id.
+        """
         if self.pipeline is None:
             raise HTTPException(status_code=500, detail="Pipeline not loaded")
 
@@ -154,8 +228,15 @@ class SDTextToImageModel:
         height = (height // 64) * 64
 
         generator = None
-        if seed is not None:
-            generator = torch.Generator(device=self.device).manual_seed(seed)
+        if any(seed is not None for seed in seeds):
+            generator = []
+            for seed in seeds:
+                item_generator = torch.Generator(device=self.device)
+                if seed is not None:
+                    item_generator.manual_seed(seed)
+                else:
+                    item_generator.seed()
+                generator.append(item_generator)
 
         try:
             # Force clip_skip (SDXL uses text_encoder + text_encoder_2)
@@ -164,41 +245,25 @@ class SDTextToImageModel:
             # For full control, you'd override the text encoder — this is a practical workaround
             # Here we assume model was trained with Clip Skip = 1 (common in epiCRealism)
 
-            logger.info(f"Generating image: {width}x{height}, Prompt: {prompt[:50]}...")
-            self.pipeline.scheduler.set_timesteps(steps)
-            result = self.pipeline(
-                prompt=prompt,
-                negative_prompt=negative_prompt,
+            logger.info(f"Generating {len(prompts)} image(s): {width}x{height}, Prompt: {prompts[0][:50]}...")
+            pipe = request_pipeline(self.pipeline)
+            pipe.scheduler.set_timesteps(steps)
+            # repeated prompts across batched jobs are encoded once
+            prompt_embeds = self.prompt_cache.encode(
+                self.pipeline, prompts, negative_prompts, guidance_scale
+            )
+            result = pipe(
+                **prompt_embeds,
                 width=width,
                 height=height,
                 num_inference_steps=steps,
                 guidance_scale=guidance_scale,
                 generator=generator,
                 output_type="pil",
-                callback_on_step_end=callback(job_id=job_id, num_steps=len(self.pipeline.scheduler.timesteps)),
+                callback_on_step_end=callback(job_id=job_ids, num_steps=len(pipe.scheduler.timesteps)),
             )
 
-            image: Image.Image = result.images[0]
-
-            # Optional: upscale
-            if apply_upscale and self.upscaler is not None:
-                import numpy as np
-                import cv2
-
-                # Convert PIL to tensor
-                img_np = np.array(image).astype(np.float32) / 255.0
-                img_tensor = torch.from_numpy(img_np).permute(2, 0, 1).unsqueeze(0).to(self.device)
-
-                # Upscale
-                with torch.no_grad():
-                    upsampled = self.upscaler(img_tensor * 2 - 1)  # [-1, 1] range
-                    upsampled = (upsampled[0].permute(1, 2, 0).cpu().numpy() + 1) / 2
-                    upsampled = (upsampled * 255).clip(0, 255).astype(np.uint8)
-
-                image = Image.fromarray(upsampled)
-                logger.info("Applied 2x upscaling")
-
-            return image
+            return result.images
 
         except torch.cuda.OutOfMemoryError:
             if torch.cuda.is_available():
@@ -1,9 +1,12 @@
 import torch
+import torch.nn.functional as F
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
 from realesrgan import RealESRGANer
 from basicsr.archs.rrdbnet_arch import RRDBNet
-
+from upscalers.png_stream import PngStreamWriter
+from upscalers.tiling import plan_tiles, tile_origins, UPSCALER_BYTES_PER_PIXEL, UPSCALER_CPU_THREADS
 
 
 class RealESRGANUpscaler:
@@ -15,11 +18,15 @@ class RealESRGANUpscaler:
         self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
         self.upsampler = None
         self.model_name = None
+        # copies finished tiles to the host while the next batch runs, alive while loaded
+        self._post = None
 
     def load_model(self, model_path: str, model_name: str = "realesrgan-x4plus", scale: int = 4,
-                   num_block: int = 23, num_feat: int = 64, num_grow_ch: int = 32):
+                   num_block: int = 23, num_feat: int = 64, num_grow_ch: int = 32,
+                   tile: int = None, tile_pad: int = 10):
         """
         Load Real-ESRGAN model from a given checkpoint path.
+        tile: fixed tile side, None picks it per image from free memory.
         """
         if self.upsampler is not None:
             return  
@@ -27,6 +34,8 @@ class RealESRGANUpscaler:
         if not model_path or not model_path.endswith('.pth'):
             raise ValueError("model_path cannot be None or empty and should end with .pth")
         self.scale = scale
+        self.tile = tile
+        self.tile_pad = tile_pad
         model = RRDBNet(
             num_in_ch=3,
             num_out_ch=3,
@@ -41,14 +50,18 @@ class RealESRGANUpscaler:
             scale=scale,
             model_path=model_path,
             model=model,
-            tile=256,
-            tile_pad=10,
+            tile=tile or 256,
+            tile_pad=tile_pad,
             pre_pad=0,
             half=self.device == "cuda",
             device=self.device,
         )
 
         self.model_name = model_name
+        self._post = ThreadPoolExecutor(max_workers=1, thread_name_prefix="upscale-post")
+        if self.device == "cpu" and UPSCALER_CPU_THREADS > 0:
+            # torch's thread count is process-wide, changing it per call would race with other inference
+            torch.set_num_threads(UPSCALER_CPU_THREADS)
 
 
     def unload_model(self):
@@ -57,16 +70,97 @@ class RealESRGANUpscaler:
         """
         self.upsampler = None
         self.model_name = None
+        if self._post is not None:
+            self._post.shutdown(wait=False)
+            self._post = None
         if torch.cuda.is_available():
             torch.cuda.empty_cache()
 
+    def _store_tiles(self, strip: np.ndarray, results: torch.Tensor, columns: list):
+        results = results.cpu().numpy()
+        for result, (left, right) in zip(results, columns):
+            strip[:, left:right] = result[:, : right - left]
+
+    @torch.no_grad()
+    def _run_tiles(self, image: Image.Image, on_strip):
+        """
+        Upscales image one row of tiles at a time. Each finished strip of
+        output rows is passed to on_strip(rows, first_row) on the helper
+        thread, in order, so at most two strips are alive at once.
+        Tiles are sized from free memory unless models.yaml fixes `tile`,
+        several tiles of a row run per forward pass.
+        Returns the output (width, height).
+        """
+        model = self.upsampler.model
+        weight = next(model.parameters())
+        device, dtype = weight.device, weight.dtype
+        scale, pad = self.scale, self.tile_pad
+
+        pixels = np.array(image.convert("RGB"))
+        height, width = pixels.shape[:2]
+        tensor = torch.from_numpy(pixels).permute(2, 0, 1)[None].to(device)
+        tensor = tensor.to(dtype) / 255.0
+        del pixels
+
+        # RRDBNet unshuffles pixels for x2 / x1 models, sizes must divide evenly
+        mod = {2: 2, 1: 4}.get(scale, 1)
+        mod_height, mod_width = (-height) % mod, (-width) % mod
+        tensor = F.pad(tensor, (pad, pad + mod_width, pad, pad + mod_height), mode="replicate")
+        padded_height, padded_width = height + mod_height, width + mod_width
+
+        bytes_per_pixel = UPSCALER_BYTES_PER_PIXEL * (2 if dtype == torch.float32 else 1)
+        tile_width, tile_height, batch_size = plan_tiles(
+            padded_width, padded_height, pad, bytes_per_pixel, device, tile=self.tile
+        )
+        lefts = tile_origins(padded_width, tile_width)
+
+        # futures of each strip still being stored / handed to on_strip
+        strips, done_rows = [], 0
+        try:
+            for top in tile_origins(padded_height, tile_height):
+                strip = np.empty((tile_height * scale, padded_width * scale, 3), dtype=np.uint8)
+                futures = []
+                for start in range(0, len(lefts), batch_size):
+                    batch = lefts[start:start + batch_size]
+                    crops = torch.cat([
+                        tensor[:, :, top:top + tile_height + 2 * pad, left:left + tile_width + 2 * pad]
+                        for left in batch
+                    ])
+                    results = model(crops)[
+                        :, :, pad * scale:(pad + tile_height) * scale, pad * scale:(pad + tile_width) * scale
+                    ]
+                    results = (results.float().clamp_(0, 1) * 255.0).round_().to(torch.uint8).permute(0, 2, 3, 1)
+                    columns = [(left * scale, (left + tile_width) * scale) for left in batch]
+                    futures.append(self._post.submit(self._store_tiles, strip, results, columns))
+
+                # the last row of tiles is shifted up, skip rows an earlier strip already covered
+                first = max(top, done_rows)
+                last = min(top + tile_height, height)
+                if last > first:
+                    rows = strip[(first - top) * scale:(last - top) * scale, : width * scale]
+                    futures.append(self._post.submit(on_strip, rows, first * scale))
+                done_rows = top + tile_height
+                strips.append(futures)
+                if len(strips) > 1:
+                    for future in strips.pop(0):
+                        future.result()
+            while strips:
+                for future in strips.pop(0):
+                    future.result()
+        finally:
+            # never leave the helper thread writing after the caller gave up
+            for futures in strips:
+                for future in futures:
+                    future.cancel() or future.exception()
+
+        return width * scale, height * scale
+
     def upscale(self, image: Image.Image) -> Image.Image:
         """
         Upscale a PIL image and return the result as a PIL image.
 
         Args:
             image: input PIL.Image.Image
-            scale: upscale factor
 
         Returns:
             output_image: upscaled PIL.Image.Image
@@ -74,7 +168,23 @@ class RealESRGANUpscaler:
         if self.upsampler is None:
             raise RuntimeError("Model not loaded. Call load() first.")
 
-        img_array = np.array(image.convert("RGB"))
-        output, _ = self.upsampler.enhance(img_array, outscale=self.scale)
+        output = np.empty((image.height * self.scale, image.width * self.scale, 3), dtype=np.uint8)
+
+        def store(rows, first_row):
+            output[first_row:first_row + len(rows)] = rows
 
+        self._run_tiles(image, store)
         return Image.fromarray(output)
+
+    def upscale_to_file(self, image: Image.Image, path: str, compress_level: int = 6):
+        """
+        Upscales straight into a PNG file. Strips of output rows are written as
+        soon as their tiles are done, so peak memory follows the strip size
+        instead of the full output.
+        """
+        if self.upsampler is None:
+            raise RuntimeError("Model not loaded. Call load() first.")
+
+        with PngStreamWriter(path, image.width * self.scale, image.height * self.scale, compress_level) as writer:
+            self._run_tiles(image, lambda rows, first_row: writer.write_rows(rows))
+        return path
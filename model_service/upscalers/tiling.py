@@ -0,0 +1,64 @@
+import os
+import math
+import torch
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Rough activation memory of RRDBNet per padded input pixel in fp16, doubled for fp32
+UPSCALER_BYTES_PER_PIXEL = int(os.getenv("UPSCALER_BYTES_PER_PIXEL", "8192"))
+# Share of free memory the tiles of one forward pass may take
+UPSCALER_MEMORY_FRACTION = float(os.getenv("UPSCALER_MEMORY_FRACTION", "0.6"))
+# Bounds of the adaptive tile side
+UPSCALER_MIN_TILE = int(os.getenv("UPSCALER_MIN_TILE", "128"))
+UPSCALER_MAX_TILE = int(os.getenv("UPSCALER_MAX_TILE", "1024"))
+# Tiles per forward pass at most
+UPSCALER_MAX_BATCH = int(os.getenv("UPSCALER_MAX_BATCH", "8"))
+# torch intra-op threads, set once when a CPU upscaler loads (process-wide), 0 keeps torch's default
+UPSCALER_CPU_THREADS = int(os.getenv("UPSCALER_CPU_THREADS", "0"))
+
+
+def free_memory(device: torch.device) -> int:
+    """Bytes the upscaler may still allocate on device."""
+    if device.type == "cuda":
+        free, _ = torch.cuda.mem_get_info(device)
+        # blocks cached by the allocator are free for us as well
+        return free + torch.cuda.memory_reserved(device) - torch.cuda.memory_allocated(device)
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        return 4 * 1024 ** 3
+
+
+def _axis_tile(length: int, tile: int, multiple: int) -> int:
+    """Smallest tile covering length with as many tiles as `tile` would need."""
+    count = math.ceil(length / tile)
+    size = math.ceil(length / count)
+    return min(length, math.ceil(size / multiple) * multiple)
+
+
+def plan_tiles(width: int, height: int, tile_pad: int, bytes_per_pixel: int, device: torch.device, tile: int = None):
+    """
+    Picks (tile_width, tile_height, batch_size) for an image.
+    Without a fixed tile, the largest square tile whose padded activations fit
+    the memory budget is used and then shrunk so tiles split the image evenly.
+    """
+    budget = free_memory(device) * UPSCALER_MEMORY_FRACTION
+    if tile is None:
+        side = int(math.sqrt(budget / bytes_per_pixel)) - 2 * tile_pad
+        tile = max(UPSCALER_MIN_TILE, min(UPSCALER_MAX_TILE, side))
+
+    tile_width = _axis_tile(width, tile, 8)
+    tile_height = _axis_tile(height, tile, 8)
+
+    padded_pixels = (tile_width + 2 * tile_pad) * (tile_height + 2 * tile_pad)
+    tiles = math.ceil(width / tile_width) * math.ceil(height / tile_height)
+    batch_size = int(budget // (padded_pixels * bytes_per_pixel))
+    batch_size = max(1, min(UPSCALER_MAX_BATCH, tiles, batch_size))
+    return tile_width, tile_height, batch_size
+
+
+def tile_origins(length: int, tile: int) -> list:
+    """Tile starts along one axis, the last tile is shifted back inside the image so all tiles have one size."""
+    count = math.ceil(length / tile)
+    return [min(i * tile, length - tile) for i in range(count)]